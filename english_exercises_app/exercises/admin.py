@@ -1,8 +1,11 @@
 from django.contrib import admin
 
-from .models import Exercise, File, Memory
+from .models import Exercise, ExerciseStats, File, Job, Memory, Text
 
 # Register your models here.
 admin.site.register(Exercise)
+admin.site.register(ExerciseStats)
 admin.site.register(File)
 admin.site.register(Memory)
+admin.site.register(Job)
+admin.site.register(Text)
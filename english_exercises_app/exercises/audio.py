@@ -0,0 +1,117 @@
+"""
+Audio for exercises, stored in MEDIA_ROOT/tts under a hash of the synthesized
+text, so every sentence is synthesized once and shared between users.
+Audio is generated in a background thread (or by a job worker, if
+USE_JOB_WORKERS is set), the exercise page polls AudioStatusView
+until it's ready.
+
+Every process has its own circuit breaker of the TTS API (see tts module).
+When it opens in the process generating audio, e.g. a job worker, other
+processes learn it from the "exercises" cache (see is_available) and stop
+requesting audio too.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from typing import Union
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+
+from text_processing import tts
+from text_processing.prepare_data import load_audio
+
+from . import jobs
+
+logger = logging.getLogger(__name__)
+
+AUDIO_DIR = "tts"
+# set for TTS_RESET_TIMEOUT seconds when the TTS API failed in any process
+UNAVAILABLE_KEY = "tts_unavailable"
+
+_generating = set()
+_generating_lock = threading.Lock()
+
+
+def get_key(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def get_name(key: str) -> str:
+    return f"{AUDIO_DIR}/{key}.wav"
+
+
+def get_path(key: str) -> str:
+    return os.path.join(settings.MEDIA_ROOT, AUDIO_DIR, f"{key}.wav")
+
+
+def get_url(key: str) -> str:
+    return default_storage.url(get_name(key))
+
+
+def is_ready(key: str) -> bool:
+    return os.path.exists(get_path(key))
+
+
+def generate(text: str) -> None:
+    """
+    Synthesizes text, unless it was synthesized before.
+    """
+
+    key = get_key(text)
+    if is_ready(key):
+        return
+    os.makedirs(os.path.dirname(get_path(key)), exist_ok=True)
+    if load_audio(get_path(key), text):
+        return
+    logger.warning("No audio generated for %s", key)
+    if tts.get_client().breaker.is_open:
+        caches["exercises"].set(UNAVAILABLE_KEY, True, tts.RESET_TIMEOUT)
+
+
+def is_available() -> bool:
+    """
+    Whether audio can be requested: TTS API is configured and isn't failing
+    in this or another process.
+    """
+
+    return tts.is_available() and not caches["exercises"].get(UNAVAILABLE_KEY)
+
+
+def request(text: str) -> Union[str, None]:
+    """
+    Returns key of the audio for text, starting its generation in background
+    if it's not ready yet. Returns None if audio generation is not configured
+    or TTS API is failing and the audio wasn't generated before.
+    """
+
+    key = get_key(text)
+    if is_ready(key):
+        return key
+    if not is_available():
+        return None
+
+    if settings.USE_JOB_WORKERS:
+        # tts jobs have no user, so they are deduplicated by text,
+        # requested by any user
+        if not jobs.has_active("tts", text=text):
+            jobs.enqueue("tts", text=text)
+        return key
+
+    with _generating_lock:
+        if key in _generating:
+            return key
+        _generating.add(key)
+
+    def run():
+        try:
+            generate(text)
+        finally:
+            with _generating_lock:
+                _generating.discard(key)
+
+    threading.Thread(target=run, daemon=True).start()
+    return key
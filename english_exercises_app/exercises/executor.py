@@ -0,0 +1,90 @@
+"""
+Bounded thread pool for blocking work of async views: exercise generation
+and parsing of uploaded texts. The event loop keeps serving other requests
+meanwhile, and no more than GENERATION_THREADS of such tasks run at once
+in a server process, however many requests are waiting for them.
+
+Work no request waits for, e.g. prefetching exercises, runs in a separate
+pool of BACKGROUND_THREADS (see submit), so it never delays requests.
+"""
+
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_background_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+
+    # created on first use, so it's not inherited by forked server workers
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.GENERATION_THREADS,
+                    thread_name_prefix="generation",
+                )
+    return _executor
+
+
+def get_background_executor() -> ThreadPoolExecutor:
+    global _background_executor
+
+    if _background_executor is None:
+        with _executor_lock:
+            if _background_executor is None:
+                _background_executor = ThreadPoolExecutor(
+                    max_workers=settings.BACKGROUND_THREADS,
+                    thread_name_prefix="background",
+                )
+    return _background_executor
+
+
+def _call(func: Callable, args: tuple, kwargs: dict):
+    # threads of the pool keep their own database connections,
+    # which are not closed by request signals
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run(func: Callable, *args, **kwargs):
+    """
+    Runs func in the pool and returns its result.
+    """
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(), functools.partial(_call, func, args, kwargs)
+    )
+
+
+def _call_logged(func: Callable, args: tuple, kwargs: dict) -> None:
+    # nobody waits for the result, so errors would be lost otherwise
+    try:
+        _call(func, args, kwargs)
+    except Exception:
+        logger.exception("Background task %s failed", func.__qualname__)
+
+
+def submit(func: Callable, *args, **kwargs) -> Future:
+    """
+    Runs func in the background pool, without waiting for it.
+    Tasks wait in a queue while all threads of the pool are busy.
+    """
+
+    return get_background_executor().submit(_call_logged, func, args, kwargs)
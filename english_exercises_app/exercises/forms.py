@@ -1,8 +1,11 @@
 from django import forms
+from django.conf import settings
+from django.db import transaction
 from django.utils.translation import gettext_lazy as _
 
-from text_processing.prepare_data import remove_data
+from text_processing.prepare_data import has_text
 
+from . import jobs, nlp, prefetch, texts
 from .models import Exercise, File, Memory
 
 
@@ -28,7 +31,7 @@ class FileForm(forms.ModelForm):
 
     def clean(self):
         """
-        Checks file format.
+        Checks file format and size.
         """
 
         cleaned_data = super().clean()
@@ -36,21 +39,49 @@ class FileForm(forms.ModelForm):
         file = cleaned_data.get("file")
         if file and not file._name.endswith(".txt"):
             raise forms.ValidationError(_("Incorrect file format"))
+        if file and file.size > settings.MAX_UPLOAD_SIZE:
+            raise forms.ValidationError(_("File is too large"), code="too_large")
 
         return cleaned_data
 
-    def save(self, user, commit=True):
-        # delete previous files and db entry, if exist
-        file = File.objects.filter(user=user).first()
-        if file is not None:
-            remove_data(file.file.path, str(user))  # rm associated json
-            file.file.delete()
-            file.delete()
+    def save(self, user, commit=True, content_hash=None):
+        previous = File.objects.filter(user=user).first()
+        prefetch.invalidate(user.pk)
 
         instance = super().save(commit=False)
         instance.user = user
         if commit:
-            instance.save()
+            if previous is not None:
+                instance.pk = previous.pk  # 1 entry per user, it's updated
+            with transaction.atomic():
+                # same texts are stored once, see texts module
+                instance.text = texts.acquire(self.cleaned_data["file"], content_hash)
+                # file name, so uploaded content isn't saved once more
+                instance.file = instance.text.file.name
+                instance.save()
+
+            # release previous text, if not used by other users, after the new
+            # one is acquired: text uploaded again by its only user is kept
+            # instead of being removed and parsed once more
+            if previous is not None and previous.text_id != instance.text_id:
+                texts.release(previous, delete=False)
+
+            # parse text once on upload instead of on every exercise,
+            # unless it was uploaded before by this or another user
+            if has_text(instance.file.path, instance.data_name):
+                return instance
+            if settings.USE_JOB_WORKERS:
+                jobs.enqueue(
+                    "ingest",
+                    user_id=user.pk,
+                    text_path=instance.file.path,
+                    username=instance.data_name,
+                )
+            else:
+                nlp.load_text(instance.file.path, instance.data_name)
+        elif previous is not None:
+            # delete previous db entry and its text, if not used by other users
+            texts.release(previous)
         return instance
 
 
@@ -135,6 +166,7 @@ class MemoryForm(forms.ModelForm):
         memory = Memory.objects.filter(user=user).first()
         if memory is not None:
             memory.delete()
+        prefetch.invalidate(user.pk)
 
         instance = super().save(commit=False)
         instance.user = user
@@ -0,0 +1,155 @@
+"""
+Background jobs, stored in the database (see Job model) and processed by
+`manage.py run_workers`. Workers claim jobs with SELECT ... FOR UPDATE
+SKIP LOCKED, so every job is taken by exactly one worker.
+
+A worker killed while running a job (e.g. by the OOM killer) leaves it
+running. Jobs running for longer than JOB_TIMEOUT are considered stale:
+they are not active anymore (see get_active) and are failed by other
+workers (see fail_stale). They are not retried, the same job would
+likely kill the next worker too. Finished jobs are deleted after
+JOB_RETENTION (see delete_finished).
+"""
+
+import logging
+import traceback
+from datetime import datetime, timedelta
+from typing import Union
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Value, When
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# job kind -> function called with job payload as keyword arguments
+HANDLERS = {
+    "ingest": "english_exercises_app.exercises.nlp.load_text",
+    "prefetch": "english_exercises_app.exercises.prefetch.refill",
+    "tts": "english_exercises_app.exercises.audio.generate",
+}
+
+# jobs of kinds with lower priority are claimed first, other kinds have
+# priority 1: uploaded texts are parsed before exercises are prefetched
+PRIORITIES = {"ingest": 0}
+
+
+def enqueue(kind: str, user_id: int = None, unique: bool = False, **payload) -> Job:
+    """
+    Adds a job to the queue. If unique is set, returns the active job
+    of the same kind for the same user instead, if there's one. A pending
+    job gets the new payload.
+    """
+
+    if unique:
+        job = get_active(kind, user_id)
+        if job is not None:
+            if job.status == Job.PENDING and job.payload != payload:
+                job.payload = payload
+                job.save(update_fields=["payload"])
+            return job
+    return Job.objects.create(kind=kind, user_id=user_id, payload=payload)
+
+
+def _stale_before() -> datetime:
+    return timezone.now() - timedelta(seconds=settings.JOB_TIMEOUT)
+
+
+def get_active(kind: str, user_id: int) -> Union[Job, None]:
+    """
+    Returns pending or running job of the given kind for the user.
+    Stale jobs are not returned.
+    """
+
+    return (
+        Job.objects.filter(
+            kind=kind, user_id=user_id, status__in=[Job.PENDING, Job.RUNNING]
+        )
+        .exclude(status=Job.RUNNING, started_at__lt=_stale_before())
+        .order_by("-pk")
+        .first()
+    )
+
+
+def has_active(kind: str, **payload) -> bool:
+    """
+    Whether there's a pending or running job of the given kind
+    with the given payload, for any user. Stale jobs are not counted.
+    """
+
+    return (
+        Job.objects.filter(
+            kind=kind, status__in=[Job.PENDING, Job.RUNNING], payload=payload
+        )
+        .exclude(status=Job.RUNNING, started_at__lt=_stale_before())
+        .exists()
+    )
+
+
+def fail_stale() -> int:
+    """
+    Marks stale jobs as failed. Returns number of failed jobs.
+    """
+
+    return Job.objects.filter(
+        status=Job.RUNNING, started_at__lt=_stale_before()
+    ).update(
+        status=Job.FAILED,
+        error="Worker stopped before finishing the job.",
+        finished_at=timezone.now(),
+    )
+
+
+def delete_finished() -> int:
+    """
+    Deletes jobs finished more than JOB_RETENTION ago.
+    Returns number of deleted jobs.
+    """
+
+    finished_before = timezone.now() - timedelta(seconds=settings.JOB_RETENTION)
+    deleted, _ = Job.objects.filter(
+        status__in=[Job.DONE, Job.FAILED], finished_at__lt=finished_before
+    ).delete()
+    return deleted
+
+
+def claim() -> Union[Job, None]:
+    """
+    Takes the oldest pending job of the highest priority (see PRIORITIES),
+    skipping jobs locked by other workers.
+    """
+
+    priority = Case(
+        *(When(kind=kind, then=Value(value)) for kind, value in PRIORITIES.items()),
+        default=Value(1),
+    )
+    with transaction.atomic():
+        job = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=Job.PENDING)
+            .order_by(priority, "pk")
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = Job.RUNNING
+        job.started_at = timezone.now()
+        job.save(update_fields=["status", "started_at"])
+    return job
+
+
+def run(job: Job) -> None:
+    try:
+        import_string(HANDLERS[job.kind])(**job.payload)
+    except Exception:
+        logger.exception("Job %s failed", job)
+        job.status = Job.FAILED
+        job.error = traceback.format_exc()
+    else:
+        job.status = Job.DONE
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "error", "finished_at"])
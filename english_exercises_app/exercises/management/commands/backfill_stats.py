@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from english_exercises_app.exercises.models import Exercise, ExerciseStats
+
+
+class Command(BaseCommand):
+    help = "Recounts stats of all users from their answers to exercises."
+
+    def handle(self, *args, **options):
+        user_ids = (
+            Exercise.objects.order_by().values_list("user_id", flat=True).distinct()
+        )
+        count = 0
+        for user_id in user_ids.iterator():
+            ExerciseStats.rebuild(user_id)
+            count += 1
+
+        # users whose answers were all deleted, e.g. in admin
+        stale = ExerciseStats.objects.exclude(user_id__in=user_ids)
+        removed, _ = stale.delete()
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Stats of {count} users recounted, {removed} removed.")
+        )
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from text_processing.exercises import NUM_SYNONYMS
+from text_processing.registry import get_synonyms_path, get_vectors
+from text_processing.synonyms import build_synonym_table
+
+
+class Command(BaseCommand):
+    help = "Precomputes synonyms of the most frequent words of GloVe vocabulary."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--words",
+            type=int,
+            default=50000,
+            help="number of most frequent words to precompute synonyms for",
+        )
+        parser.add_argument(
+            "--margin",
+            type=int,
+            default=5,
+            help="synonyms to store in addition to NUM_SYNONYMS",
+        )
+        parser.add_argument("--path", default=None, help="output path prefix")
+
+    def handle(self, *args, **options):
+        path = options["path"] or get_synonyms_path()
+        start = time.perf_counter()
+
+        table = build_synonym_table(
+            get_vectors(), options["words"], NUM_SYNONYMS + options["margin"]
+        )
+        table.save(path)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Synonyms for {len(table.neighbours)} words saved to {path} "
+                f"in {time.perf_counter() - start:.1f}s. "
+                "Restart the server to use them."
+            )
+        )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from english_exercises_app.exercises.models import File
+from text_processing.prepare_data import convert_data
+
+
+class Command(BaseCommand):
+    help = (
+        "Converts sentences (.json) and parsed texts (.spacy) of uploaded files "
+        "to stores read through mmap."
+    )
+
+    def handle(self, *args, **options):
+        converted = 0
+        for file in File.objects.select_related("user"):
+            if convert_data(file.file.path, file.data_name):
+                converted += 1
+                self.stdout.write(f"Converted text of {file.user}")
+
+        self.stdout.write(self.style.SUCCESS(f"{converted} texts converted."))
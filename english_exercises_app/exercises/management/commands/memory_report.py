@@ -0,0 +1,66 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def read_memory(pid: int) -> dict:
+    """
+    Reads resident (Rss) and proportional (Pss) set sizes of a process in kB.
+    Pss splits shared pages between processes sharing them, so the sum of Pss
+    over all workers is the actual memory used by the server.
+    """
+
+    memory = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("Rss", "Pss", "Shared_Clean", "Private_Dirty"):
+                memory[key] = int(value.split()[0])
+    return memory
+
+
+def find_children(ppid: int) -> list:
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # process name may contain spaces, ppid goes after it
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:  # process exited
+            continue
+        if int(fields[1]) == ppid:
+            children.append(int(entry))
+    return sorted(children)
+
+
+class Command(BaseCommand):
+    help = "Shows RSS/PSS memory of a gunicorn master and its workers (Linux only)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("pid", type=int, help="gunicorn master process id")
+
+    def handle(self, *args, **options):
+        master = options["pid"]
+        if not os.path.exists(f"/proc/{master}/smaps_rollup"):
+            raise CommandError(f"Can't read memory of process {master}.")
+
+        rows = [("master", master)]
+        rows += [("worker", pid) for pid in find_children(master)]
+
+        self.stdout.write(
+            f"{'process':<8}{'pid':>8}{'RSS, MB':>10}{'PSS, MB':>10}"
+            f"{'shared, MB':>12}{'private, MB':>13}"
+        )
+        total_pss = 0
+        for name, pid in rows:
+            memory = read_memory(pid)
+            total_pss += memory["Pss"]
+            self.stdout.write(
+                f"{name:<8}{pid:>8}{memory['Rss'] / 1024:>10.1f}"
+                f"{memory['Pss'] / 1024:>10.1f}"
+                f"{memory['Shared_Clean'] / 1024:>12.1f}"
+                f"{memory['Private_Dirty'] / 1024:>13.1f}"
+            )
+        self.stdout.write(f"Total PSS: {total_pss / 1024:.1f} MB")
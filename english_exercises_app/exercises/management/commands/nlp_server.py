@@ -0,0 +1,53 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from text_processing.nlp_server import NLP_SERVER_THREADS, NLPServer
+from text_processing.registry import warm_up
+
+
+class Command(BaseCommand):
+    help = (
+        "Loads NLP models once and serves text processing to web and job "
+        "worker processes over a Unix socket, see text_processing.nlp_server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--socket",
+            default=settings.NLP_SERVER_SOCKET,
+            help="path of the socket, NLP_SERVER_SOCKET by default",
+        )
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=NLP_SERVER_THREADS,
+            help="maximum number of requests processed at once",
+        )
+
+    def handle(self, *args, **options):
+        if not options["socket"]:
+            raise CommandError("Set NLP_SERVER_SOCKET or pass --socket.")
+
+        for name, seconds in warm_up().items():
+            self.stdout.write(f"{name} ready in {seconds:.2f}s")
+
+        server = NLPServer(options["socket"], options["threads"])
+
+        def stop(signum, frame):
+            # shutdown() waits for serve_forever(), which runs in this thread
+            threading.Thread(target=server.shutdown).start()
+
+        signal.signal(signal.SIGTERM, stop)
+        self.stdout.write(
+            self.style.SUCCESS(f"Serving text processing on {options['socket']}.")
+        )
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from english_exercises_app.exercises.texts import remove_unused
+
+
+class Command(BaseCommand):
+    help = "Removes uploaded texts and their data not used by any user."
+
+    def handle(self, *args, **options):
+        removed = remove_unused()
+        self.stdout.write(self.style.SUCCESS(f"{removed} texts removed."))
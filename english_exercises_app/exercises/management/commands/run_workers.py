@@ -0,0 +1,91 @@
+import gc
+import multiprocessing
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from english_exercises_app.exercises import jobs
+from english_exercises_app.exercises.nlp import warm_up
+
+# seconds between deletions of old finished jobs by each worker
+CLEANUP_INTERVAL = 3600
+
+
+def work(poll_interval: float) -> None:
+    """
+    Worker process loop: runs jobs one by one until SIGTERM or SIGINT.
+    """
+
+    stopping = False
+    next_cleanup = 0.0
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while not stopping:
+        job = jobs.claim()
+        if job is None:
+            jobs.fail_stale()  # jobs of killed workers
+            if time.monotonic() >= next_cleanup:
+                jobs.delete_finished()
+                next_cleanup = time.monotonic() + CLEANUP_INTERVAL
+            time.sleep(poll_interval)
+        else:
+            jobs.run(job)
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Runs worker processes for background jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=settings.JOB_WORKERS,
+            help="number of worker processes",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="seconds to wait before checking for new jobs again",
+        )
+
+    def handle(self, *args, **options):
+        # load models once, workers share them after fork
+        # (unless text is processed by the NLP server)
+        warm_up()
+        gc.freeze()
+        # every worker has to open its own database connection
+        connections.close_all()
+
+        processes = [
+            multiprocessing.Process(target=work, args=(options["poll_interval"],))
+            for _ in range(options["processes"])
+        ]
+        for process in processes:
+            process.start()
+
+        def terminate(signum, frame):
+            for process in processes:
+                process.terminate()  # workers finish current jobs and exit
+
+        signal.signal(signal.SIGTERM, terminate)
+        self.stdout.write(
+            self.style.SUCCESS(f"Started {len(processes)} worker processes.")
+        )
+
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:  # children got SIGINT too and are stopping
+            for process in processes:
+                process.join()
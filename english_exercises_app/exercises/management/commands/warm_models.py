@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from text_processing.registry import warm_up
+
+
+class Command(BaseCommand):
+    help = "Loads (and downloads, if needed) spaCy and GloVe models."
+
+    def handle(self, *args, **options):
+        for name, seconds in warm_up().items():
+            self.stdout.write(self.style.SUCCESS(f"{name} ready in {seconds:.2f}s"))
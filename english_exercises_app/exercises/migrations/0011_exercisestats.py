@@ -0,0 +1,36 @@
+# Generated by Django 4.2.4 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("exercises", "0010_text_file_text"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExerciseStats",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("total", models.PositiveIntegerField(default=0)),
+                ("correct", models.PositiveIntegerField(default=0)),
+                ("recent", models.CharField(blank=True, default="", max_length=100)),
+            ],
+            options={
+                "verbose_name": "Exercise stats",
+                "verbose_name_plural": "Exercise stats",
+            },
+        ),
+    ]
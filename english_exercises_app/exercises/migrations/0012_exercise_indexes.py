@@ -0,0 +1,49 @@
+# Generated by Django 4.2.4 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # indexes are built without locking tables of a running app
+    atomic = False
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("exercises", "0011_exercisestats"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="exercise",
+            index=models.Index(fields=["user", "-id"], name="exercise_user_recent_idx"),
+        ),
+        AddIndexConcurrently(
+            model_name="exercise",
+            index=models.Index(
+                condition=models.Q(("flag", True)),
+                fields=["user", "-id"],
+                name="exercise_user_correct_idx",
+            ),
+        ),
+        # replaced by exercise_user_recent_idx, dropped after it's built
+        migrations.AlterField(
+            model_name="exercise",
+            name="user",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="job",
+            index=models.Index(
+                condition=models.Q(("status__in", ["pending", "running"])),
+                fields=["user", "kind", "-id"],
+                name="job_user_active_idx",
+            ),
+        ),
+    ]
@@ -1,6 +1,10 @@
+from typing import Union
+
 from django.conf import settings
 from django.contrib.postgres.fields import ArrayField
-from django.db import models
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Right
 from django.utils.translation import gettext_lazy as _
 
 
@@ -17,11 +21,42 @@ class BaseFileModel(models.Model):
         abstract = True
 
 
+class Text(models.Model):
+    """
+    Uploaded text, stored once per content and shared by files
+    of all users who uploaded it, see texts module.
+    """
+
+    content_hash = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to="texts/")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.content_hash
+
+    class Meta:
+        verbose_name = _("Text")
+        verbose_name_plural = _("Texts")
+
+
 class File(BaseFileModel):
     """
     Stores information about the current text file.
+    Files uploaded before texts were shared have no text.
     """
 
+    text = models.ForeignKey(
+        Text, on_delete=models.PROTECT, related_name="files", blank=True, null=True
+    )
+
+    @property
+    def data_name(self) -> str:
+        """
+        Name of sentence and parsed text files, see text_processing.prepare_data.
+        """
+
+        return self.text.content_hash if self.text_id else str(self.user)
+
     class Meta:
         verbose_name = _("File")
         verbose_name_plural = _("Files")
@@ -42,8 +77,9 @@ class Exercise(models.Model):
     Stores information about user answers.
     """
 
+    # lookups by user are covered by exercise_user_recent_idx
     user = models.ForeignKey(
-        settings.AUTH_USER_MODEL, on_delete=models.CASCADE
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=False
     )
     exercise_type = models.CharField(max_length=255)
     user_answer = models.CharField(max_length=255)
@@ -55,7 +91,14 @@ class Exercise(models.Model):
             self.flag = True
         else:
             self.flag = False
-        super().save(*args, **kwargs)
+
+        if not self._state.adding:
+            super().save(*args, **kwargs)
+            return
+        # new answer and its stats are committed together
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            ExerciseStats.record(self.user_id, self.flag)
 
     def __str__(self):
         return (
@@ -68,12 +111,145 @@ class Exercise(models.Model):
     class Meta:
         verbose_name = _("Exercise")
         verbose_name_plural = _("Exercises")
+        indexes = [
+            # last answers of a user, see ExerciseStats.rebuild
+            models.Index(fields=["user", "-id"], name="exercise_user_recent_idx"),
+            # correct answers of a user, without scanning the incorrect ones
+            models.Index(
+                fields=["user", "-id"],
+                condition=models.Q(flag=True),
+                name="exercise_user_correct_idx",
+            ),
+        ]
+
+
+class ExerciseStats(models.Model):
+    """
+    Per-user totals of answers, kept up to date by Exercise.save,
+    so stats don't have to be counted over the whole user history.
+    Answers changed or deleted elsewhere (e.g. in admin) are reflected
+    after `manage.py backfill_stats`.
+    """
+
+    WINDOW = 100  # number of last answers kept in recent
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True
+    )
+    total = models.PositiveIntegerField(default=0)
+    correct = models.PositiveIntegerField(default=0)
+    # flags of the last WINDOW answers, oldest first: "1" correct, "0" not
+    recent = models.CharField(max_length=WINDOW, blank=True, default="")
+
+    def recent_correct(self, n: int = WINDOW) -> int:
+        """
+        Number of correct answers among the last n.
+        """
+
+        return self.recent[-n:].count("1") if n > 0 else 0
+
+    @classmethod
+    def record(cls, user_id: int, flag: bool) -> None:
+        """
+        Adds an answer to stats of a user with a single UPDATE,
+        so concurrent answers of the same user are all counted.
+        """
+
+        char = "1" if flag else "0"
+        stats = cls.objects.filter(user_id=user_id)
+        changes = {
+            "total": F("total") + 1,
+            "correct": F("correct") + int(flag),
+            "recent": Right(Concat(F("recent"), Value(char)), cls.WINDOW),
+        }
+        if stats.update(**changes):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(
+                    user_id=user_id, total=1, correct=int(flag), recent=char
+                )
+        except IntegrityError:  # created by a concurrent answer
+            stats.update(**changes)
+
+    @classmethod
+    def rebuild(cls, user_id: int) -> "ExerciseStats":
+        """
+        Recounts stats of a user from Exercise rows.
+        """
+
+        with transaction.atomic():
+            # answers saved meanwhile wait for the lock and are added on top
+            stats, created = cls.objects.select_for_update().get_or_create(
+                user_id=user_id
+            )
+            exercises = Exercise.objects.filter(user_id=user_id)
+            flags = exercises.order_by("-pk").values_list("flag", flat=True)
+            stats.total = exercises.count()
+            stats.correct = exercises.filter(flag=True).count()
+            stats.recent = "".join(
+                "1" if flag else "0" for flag in list(flags[: cls.WINDOW])[::-1]
+            )
+            stats.save()
+        return stats
+
+    def __str__(self):
+        return f"{self.user}: {self.correct} / {self.total}"
+
+    class Meta:
+        verbose_name = _("Exercise stats")
+        verbose_name_plural = _("Exercise stats")
+
+
+class Job(models.Model):
+    """
+    Background task, processed by `manage.py run_workers`.
+    See jobs module for available kinds of jobs.
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = (
+        (PENDING, _("Pending")),
+        (RUNNING, _("Running")),
+        (DONE, _("Done")),
+        (FAILED, _("Failed")),
+    )
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, blank=True, null=True
+    )
+    kind = models.CharField(max_length=63)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=15, choices=STATUSES, default=PENDING)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+    class Meta:
+        verbose_name = _("Job")
+        verbose_name_plural = _("Jobs")
+        indexes = [
+            models.Index(fields=["status", "id"], name="job_status_idx"),
+            # active jobs of a user, checked on every exercise, see jobs.get_active
+            models.Index(
+                fields=["user", "kind", "-id"],
+                condition=models.Q(status__in=["pending", "running"]),
+                name="job_user_active_idx",
+            ),
+        ]
 
 
 class Memory(models.Model):
     """
     Stores current parameters for exercises.
-    Has method to increment number of current exercise.
+    Has method to move to the next exercise, see advance().
     """
 
     user = models.OneToOneField(
@@ -91,17 +267,28 @@ class Memory(models.Model):
     add_audio = models.BooleanField(blank=True, null=True)
 
     @classmethod
-    def get_current_count(cls):
-        counter, created = cls.objects.get_or_create(pk=1)
-        return counter.current_count
+    def advance(
+        cls, user_id: int, expected: Union[int, None] = None
+    ) -> Union[int, None]:
+        """
+        Moves user to the next exercise with a single UPDATE, so concurrent
+        requests (double clicks, several tabs) neither lose nor repeat steps.
+        If expected is given, moves only from that exercise, so repeated
+        requests to move from the same exercise move once.
+        Returns number of the current exercise, None if nothing was updated.
+        """
 
-    @classmethod
-    def increment_count(cls):
-        counter, created = cls.objects.get_or_create(pk=1)
-        counter.current_count += 1
+        table = connection.ops.quote_name(cls._meta.db_table)
+        sql = (
+            f"UPDATE {table} SET current_count = current_count + 1 "
+            "WHERE user_id = %s"
+        )
+        params = [user_id]
+        if expected is not None:
+            sql += " AND current_count = %s"
+            params.append(expected)
 
-        if counter.current_count == counter.count:
-            counter.delete()
-        else:
-            counter.count += 1
-            counter.save()
+        with connection.cursor() as cursor:
+            cursor.execute(f"{sql} RETURNING current_count", params)
+            row = cursor.fetchone()
+        return row[0] if row else None
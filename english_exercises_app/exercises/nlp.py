@@ -0,0 +1,58 @@
+"""
+Text processing of the app. Runs in this process, or, if NLP_SERVER_SOCKET
+is set, in `manage.py nlp_server`, so web and job worker processes
+don't load models at all (see text_processing.nlp_server).
+"""
+
+import threading
+from typing import Dict, Union
+
+from django.conf import settings
+
+from text_processing import prepare_data, registry
+from text_processing.nlp_server import NLPClient
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> Union[NLPClient, None]:
+    """
+    Returns client of the NLP server, None if text is processed in-process.
+    """
+
+    global _client
+
+    if not settings.NLP_SERVER_SOCKET:
+        return None
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = NLPClient(settings.NLP_SERVER_SOCKET)
+    return _client
+
+
+def load_text(text_path: str, username: str) -> None:
+    client = get_client()
+    if client is None:
+        prepare_data.load_text(text_path, username)
+    else:
+        client.load_text(text_path, username)
+
+
+def prepare_exercises(filepath: str, **kwargs) -> dict:
+    client = get_client()
+    if client is None:
+        return prepare_data.prepare_exercises(filepath, **kwargs)
+    return client.prepare_exercises(filepath, **kwargs)
+
+
+def warm_up() -> Dict[str, float]:
+    """
+    Loads models, unless they are loaded by the NLP server.
+    Returns seconds spent on each model, see registry.warm_up.
+    """
+
+    if get_client() is not None:
+        return {}
+    return registry.warm_up()
@@ -0,0 +1,185 @@
+"""
+Queues of pre-generated exercises, one per user, kept in the "exercises" cache.
+After an exercise is served, the queue is refilled in the background pool
+(see executor.submit), or by a job worker if USE_JOB_WORKERS is set,
+so the next exercise is usually ready before it's requested.
+
+Queue is bound to a version (current File and Memory entries of the user),
+exercises generated for other parameters are never served.
+
+Exercises of a queue are stored in slots, each under its own key, so that
+concurrent requests and refills never read and write back the whole queue.
+Every stored exercise also gets a ticket, a key that is never reused.
+An exercise is served only by the request that deleted its ticket:
+deleting a key is atomic in cache backends (a file removal for
+FileBasedCache), so two requests can't serve the same exercise.
+"""
+
+import logging
+import threading
+import uuid
+from typing import List, Union
+
+from django.conf import settings
+from django.core.cache import caches
+
+from text_processing.exercises import GenerationError
+
+from . import executor, jobs, nlp
+
+logger = logging.getLogger(__name__)
+
+_refilling = set()
+_refilling_lock = threading.Lock()
+
+
+def _get_key(user_pk: int) -> str:
+    return f"exercise_queue:{user_pk}"
+
+
+def _get_slot_keys(user_pk: int) -> List[str]:
+    return [
+        f"exercise_queue:{user_pk}:{slot}"
+        for slot in range(settings.EXERCISES_PREFETCH_COUNT)
+    ]
+
+
+def get_version(file, params) -> str:
+    # forms replace File and Memory entries, so new entries get new pks
+    return f"{file.pk}:{params.pk}"
+
+
+def generate(filepath: str, kwargs: dict) -> dict:
+    # text processing is thread-safe, see text_processing.pipelines
+    return nlp.prepare_exercises(filepath, **kwargs)
+
+
+def _get_ticket_key(ticket: str) -> str:
+    return f"exercise_ticket:{ticket}"
+
+
+def _is_queued(item: Union[dict, None], version: str) -> bool:
+    # exercise was served if its ticket is gone
+    return (
+        item is not None
+        and item["version"] == version
+        and caches["exercises"].has_key(_get_ticket_key(item["ticket"]))
+    )
+
+
+def pop(user_pk: int, version: str) -> Union[dict, None]:
+    """
+    Returns next pre-generated exercise, None if there's none.
+    """
+
+    cache = caches["exercises"]
+    slots = cache.get_many(_get_slot_keys(user_pk))
+    for key, item in slots.items():
+        if item["version"] != version:
+            continue
+        # of concurrent requests, only one deletes the ticket and serves it
+        if cache.delete(_get_ticket_key(item["ticket"])):
+            # slot may have been filled again meanwhile
+            current = cache.get(key)
+            if current is not None and current["ticket"] == item["ticket"]:
+                cache.delete(key)
+            return item["exercise"]
+    return None
+
+
+def invalidate(user_pk: int) -> None:
+    """
+    Drops pre-generated exercises, stops refills running for old parameters.
+    """
+
+    cache = caches["exercises"]
+    cache.set(_get_key(user_pk), None)
+    slots = cache.get_many(_get_slot_keys(user_pk))
+    cache.delete_many([_get_ticket_key(item["ticket"]) for item in slots.values()])
+    cache.delete_many(list(slots))
+
+
+def _count(user_pk: int, version: str) -> int:
+    slots = caches["exercises"].get_many(_get_slot_keys(user_pk))
+    return sum(_is_queued(item, version) for item in slots.values())
+
+
+def _store(user_pk: int, version: str, exercise: dict) -> bool:
+    """
+    Puts exercise in a free slot. Returns False if all slots are taken.
+    """
+
+    cache = caches["exercises"]
+    for key in _get_slot_keys(user_pk):
+        item = cache.get(key)
+        if _is_queued(item, version):
+            continue
+        if item is not None:  # left from old parameters
+            cache.delete(_get_ticket_key(item["ticket"]))
+
+        ticket = uuid.uuid4().hex
+        cache.set(_get_ticket_key(ticket), True)
+        item = {"version": version, "exercise": exercise, "ticket": ticket}
+        cache.set(key, item)
+        return True
+    return False
+
+
+def refill(user_pk: int, version: str, filepath: str, kwargs: dict) -> None:
+    """
+    Generates exercises until there are EXERCISES_PREFETCH_COUNT of them.
+    Stops if parameters were changed meanwhile.
+    """
+
+    cache = caches["exercises"]
+    key = _get_key(user_pk)
+    if cache.get(key) != version:
+        cache.set(key, version)
+
+    while _count(user_pk, version) < settings.EXERCISES_PREFETCH_COUNT:
+        try:
+            exercise = generate(filepath, kwargs)
+        except (FileNotFoundError, GenerationError):
+            logger.exception("Failed to prefetch exercise for user %s", user_pk)
+            return
+
+        # queue may have been invalidated while generating
+        if cache.get(key) != version:
+            return
+        if not _store(user_pk, version, exercise):
+            return
+
+
+def refill_async(user_pk: int, version: str, filepath: str, kwargs: dict) -> None:
+    """
+    Refills the queue in the background pool (see executor.submit),
+    unless it's full or being refilled.
+    """
+
+    if _count(user_pk, version) >= settings.EXERCISES_PREFETCH_COUNT:
+        return
+    if settings.USE_JOB_WORKERS:
+        jobs.enqueue(
+            "prefetch",
+            user_id=user_pk,
+            unique=True,
+            user_pk=user_pk,
+            version=version,
+            filepath=filepath,
+            kwargs=kwargs,
+        )
+        return
+
+    with _refilling_lock:
+        if user_pk in _refilling:
+            return
+        _refilling.add(user_pk)
+
+    def run():
+        try:
+            refill(user_pk, version, filepath, kwargs)
+        finally:
+            with _refilling_lock:
+                _refilling.discard(user_pk)
+
+    executor.submit(run)
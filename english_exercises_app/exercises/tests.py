@@ -1,3 +1,1328 @@
-from django.test import TestCase
+import io
+import itertools
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from text_processing import (
+    ingest,
+    nlp_server,
+    prepare_data,
+    registry,
+    synonyms,
+    tts,
+)
+from text_processing.cache import LRUCache
+from text_processing.exercises import NoSentencesError
+from text_processing.parsed_text import ParsedText, TextIndex
+from text_processing.pipelines import PipelinePool
+from text_processing.spacy_token_processing import select_skippable_tokens
+from text_processing.store import (
+    WORD_COUNT,
+    ArrayStore,
+    DocStore,
+    RecordStore,
+    SentenceStore,
+)
+from text_processing.windows import WindowSampler
+
+from . import audio, jobs, nlp, prefetch, texts
+from .forms import FileForm
+from .models import Exercise, ExerciseStats, File, Job, Memory, Text
+
+User = get_user_model()
+
+EXERCISE = {
+    "exercise_type": "type_in",
+    "correct_answer": "cat",
+    "begin": "The ",
+    "end": " sat on the mat.",
+    "options": [],
+}
+# rows of Exercise table for EXPLAIN tests, spread over EXPLAIN_USERS users
+EXPLAIN_ROWS = int(os.getenv("TEST_EXPLAIN_ROWS", 1_000_000))
+EXPLAIN_USERS = 1000
+# pages are rendered without running collectstatic first
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+    },
+}
+
+
+def add_answers(user, n, correct_every=2):
+    for i in range(n):
+        answer = "cat" if i % correct_every == 0 else "dog"
+        Exercise(
+            user=user,
+            exercise_type="type_in",
+            user_answer=answer,
+            correct_answer="cat",
+        ).save()
+
+
+@override_settings(STORAGES=STORAGES)
+class QueryBudgetTests(TestCase):
+    """
+    Number of queries of every exercise view is fixed,
+    in particular it doesn't grow with user history.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("alice", password="password")
+        cls.file = File.objects.create(user=cls.user, file="texts/alice.txt")
+        cls.params = Memory.objects.create(
+            user=cls.user,
+            count=10,
+            current_count=1,
+            pos=["NOUN"],
+            exercise_type="type_in",
+            length=1,
+            skip_length=3,
+            add_audio=False,
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def get_exercise(self, **params):
+        with mock.patch("english_exercises_app.exercises.prefetch.pop") as pop:
+            with mock.patch("english_exercises_app.exercises.prefetch.refill_async"):
+                pop.return_value = dict(EXERCISE)
+                return self.client.get(reverse("exercise_show"), params)
+
+    def test_upload_and_create_pages(self):
+        # session and user
+        with self.assertNumQueries(2):
+            self.client.get(reverse("exercise_upload"))
+        with self.assertNumQueries(2):
+            self.client.get(reverse("exercise_create"))
+
+    def test_show_exercise(self):
+        # session, user, file, parameters, active jobs
+        with self.assertNumQueries(5):
+            response = self.get_exercise()
+        self.assertEqual(response.status_code, 200)
+
+        # and moving to the next exercise
+        with self.assertNumQueries(6):
+            self.get_exercise(next="true")
+        with self.assertNumQueries(6):
+            self.get_exercise(next="2")
+        # and current exercise, if it was moved from already
+        with self.assertNumQueries(7):
+            self.get_exercise(next="2")
+        self.assertEqual(Memory.objects.get(user=self.user).current_count, 3)
+
+    def test_answer(self):
+        data = dict(EXERCISE, user_answer="cat", hint="Type your answer")
+        data.update(count=10, current_count=1)
+        # the first answer creates stats row
+        with self.assertNumQueries(9):
+            self.client.post(reverse("exercise_show"), data)
+
+        for n_answers in (0, 1, 300):
+            add_answers(self.user, n_answers)
+            # session, user, answer and its stats in a transaction
+            with self.assertNumQueries(6):
+                response = self.client.post(reverse("exercise_show"), data)
+            self.assertEqual(response.status_code, 200)
+
+        stats = ExerciseStats.objects.get(user=self.user)
+        self.assertEqual(stats.total, Exercise.objects.filter(user=self.user).count())
+
+    def test_score(self):
+        Memory.objects.filter(pk=self.params.pk).update(current_count=10)
+        add_answers(self.user, 300, correct_every=3)
+        # and stats for the score
+        with self.assertNumQueries(6):
+            self.get_exercise()
+
+    def test_stats(self):
+        for n_answers in (1, 99, 900):
+            add_answers(self.user, n_answers)
+            with self.assertNumQueries(3):
+                response = self.client.get(reverse("exercise_stats"))
+            self.assertEqual(response.status_code, 200)
+
+        stats = ExerciseStats.objects.get(user=self.user)
+        self.assertEqual(stats.total, 1000)
+        self.assertEqual(stats.correct, 1 + 50 + 450)
+        self.assertEqual(stats.recent_correct(), 50)
+
+    def test_stats_delete(self):
+        add_answers(self.user, 300)
+        # session, user, answers and stats in a transaction
+        with self.assertNumQueries(6):
+            self.client.post(reverse("exercise_stats_delete"))
+        self.assertFalse(Exercise.objects.filter(user=self.user).exists())
+        self.assertFalse(ExerciseStats.objects.filter(user=self.user).exists())
+
+    def test_job_status(self):
+        job = Job.objects.create(user=self.user, kind="ingest")
+        with self.assertNumQueries(3):
+            self.client.get(reverse("job_status", args=[job.pk]))
+
+    def test_backfill(self):
+        add_answers(self.user, 300, correct_every=3)
+        ExerciseStats.objects.filter(user=self.user).delete()
+        # stats row, two counts and last answers in a transaction
+        with self.assertNumQueries(10):
+            stats = ExerciseStats.rebuild(self.user.pk)
+        self.assertEqual((stats.total, stats.correct), (300, 100))
+        self.assertEqual(len(stats.recent), ExerciseStats.WINDOW)
+        self.assertEqual(stats.recent_correct(), 33)
+
+
+class UploadTests(TestCase):
+    """
+    Same texts uploaded by several users are stored once, and removed
+    with the last file referencing them.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user("alice", password="x")
+        cls.bob = User.objects.create_user("bob", password="x")
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        overrides = override_settings(MEDIA_ROOT=directory)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.load_text = mock.patch.object(nlp, "load_text").start()
+        mock.patch.object(prefetch, "invalidate").start()
+        self.addCleanup(mock.patch.stopall)
+
+    def upload(self, user, content):
+        upload = SimpleUploadedFile("text.txt", content.encode())
+        form = FileForm(data={}, files={"file": upload})
+        self.assertTrue(form.is_valid(), form.errors)
+        return form.save(user)
+
+    def test_same_text(self):
+        alice_file = self.upload(self.alice, "The wolf walked.")
+        bob_file = self.upload(self.bob, "The wolf walked.")
+
+        text = Text.objects.get()
+        self.assertEqual(alice_file.text, text)
+        self.assertEqual(bob_file.text, text)
+        self.assertEqual(bob_file.file.path, text.file.path)
+        stored = os.listdir(os.path.dirname(text.file.path))
+        self.assertEqual(stored, [os.path.basename(text.file.path)])
+        self.assertEqual(bob_file.data_name, text.content_hash)
+
+    def test_same_text_again(self):
+        self.upload(self.alice, "The wolf walked.")
+        text = Text.objects.get()
+        for extension in (".docs", ".index"):
+            path = prepare_data.get_filepath(
+                text.file.path, text.content_hash, extension=extension
+            )
+            with open(path, "w") as f:
+                f.write("parsed")
+
+        # text of the only user isn't removed and parsed once more
+        file = self.upload(self.alice, "The wolf walked.")
+        self.assertEqual(Text.objects.get(), text)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(list(File.objects.filter(user=self.alice)), [file])
+        self.assertEqual(self.load_text.call_count, 1)
+
+    def test_last_file_removes_text(self):
+        self.upload(self.alice, "The wolf walked.")
+        self.upload(self.bob, "The wolf walked.")
+        text = Text.objects.get()
+        data_path = prepare_data.get_filepath(
+            text.file.path, text.content_hash, extension=".sentences"
+        )
+        with open(data_path, "w") as f:
+            f.write("parsed")
+
+        self.upload(self.alice, "Hi.")
+        self.assertTrue(os.path.exists(text.file.path))
+        self.upload(self.bob, "Hi.")
+        self.assertFalse(Text.objects.filter(pk=text.pk).exists())
+        self.assertFalse(os.path.exists(text.file.path))
+        self.assertFalse(os.path.exists(data_path))
+        self.assertEqual(Text.objects.count(), 1)
+
+    def test_remove_unused(self):
+        self.upload(self.alice, "The wolf walked.")
+        path = Text.objects.get().file.path
+        File.objects.all().delete()
+        self.assertEqual(texts.remove_unused(), 1)
+        self.assertFalse(Text.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+
+@override_settings(JOB_TIMEOUT=60)
+class JobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("worker", password="x")
+
+    def add_job(self, status, started_seconds_ago=None):
+        job = jobs.enqueue("ingest", user_id=self.user.pk)
+        job.status = status
+        if started_seconds_ago is not None:
+            job.started_at = timezone.now() - timedelta(seconds=started_seconds_ago)
+        job.save()
+        return job
+
+    def test_stale_job_is_not_active(self):
+        stale = self.add_job(Job.RUNNING, started_seconds_ago=120)
+        self.assertIsNone(jobs.get_active("ingest", self.user.pk))
+
+        running = self.add_job(Job.RUNNING, started_seconds_ago=10)
+        self.assertEqual(jobs.get_active("ingest", self.user.pk), running)
+        running.delete()
+
+        pending = self.add_job(Job.PENDING)
+        self.assertEqual(jobs.get_active("ingest", self.user.pk), pending)
+        self.assertNotEqual(pending, stale)
+
+    def test_fail_stale(self):
+        stale = self.add_job(Job.RUNNING, started_seconds_ago=120)
+        running = self.add_job(Job.RUNNING, started_seconds_ago=10)
+        pending = self.add_job(Job.PENDING)
+
+        self.assertEqual(jobs.fail_stale(), 1)
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, Job.FAILED)
+        self.assertTrue(stale.error)
+        self.assertIsNotNone(stale.finished_at)
+        for job in (running, pending):
+            status = job.status
+            job.refresh_from_db()
+            self.assertEqual(job.status, status)
+
+    def test_unique_enqueue(self):
+        job = jobs.enqueue("prefetch", self.user.pk, unique=True, version="1:1")
+        same = jobs.enqueue("prefetch", self.user.pk, unique=True, version="1:2")
+        self.assertEqual(same, job)
+        job.refresh_from_db()
+        self.assertEqual(job.payload, {"version": "1:2"})  # latest parameters
+
+        job.status = Job.RUNNING
+        job.started_at = timezone.now()
+        job.save()
+        same = jobs.enqueue("prefetch", self.user.pk, unique=True, version="1:3")
+        self.assertEqual(same, job)
+        self.assertEqual(same.payload, {"version": "1:2"})
+
+        job.started_at = timezone.now() - timedelta(seconds=120)
+        job.save()
+        self.assertNotEqual(
+            jobs.enqueue("prefetch", self.user.pk, unique=True, version="1:3"), job
+        )
+
+    def test_claim_ingest_first(self):
+        prefetch_job = jobs.enqueue("prefetch", self.user.pk)
+        ingest_job = jobs.enqueue("ingest", self.user.pk)
+        self.assertEqual(jobs.claim(), ingest_job)
+        self.assertEqual(jobs.claim(), prefetch_job)
+        self.assertIsNone(jobs.claim())
+
+    @override_settings(JOB_RETENTION=60)
+    def test_delete_finished(self):
+        old = [self.add_job(status) for status in (Job.DONE, Job.FAILED)]
+        Job.objects.update(finished_at=timezone.now() - timedelta(seconds=120))
+        recent = self.add_job(Job.DONE)
+        recent.finished_at = timezone.now()
+        recent.save()
+        stale = self.add_job(Job.RUNNING, started_seconds_ago=120)
+
+        self.assertEqual(jobs.delete_finished(), 2)
+        self.assertFalse(Job.objects.filter(pk__in=[job.pk for job in old]).exists())
+        self.assertEqual(set(Job.objects.all()), {recent, stale})
+
+
+@override_settings(USE_JOB_WORKERS=True)
+class AudioRequestTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        cache = {**settings.CACHES["exercises"], "LOCATION": directory}
+        overrides = override_settings(
+            MEDIA_ROOT=directory, CACHES={"default": cache, "exercises": cache}
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        # TTS API works as far as this process knows
+        available = mock.patch.object(audio.tts, "is_available", return_value=True)
+        available.start()
+        self.addCleanup(available.stop)
+
+    def test_one_job_per_text(self):
+        for _ in range(3):
+            audio.request("The wolf walked.")
+        audio.request("Hi.")
+        self.assertEqual(Job.objects.filter(kind="tts").count(), 2)
+
+        job = Job.objects.get(payload={"text": "The wolf walked."})
+        job.status = Job.RUNNING
+        job.started_at = timezone.now()
+        job.save()
+        audio.request("The wolf walked.")
+        self.assertEqual(Job.objects.filter(kind="tts").count(), 2)
+
+        job.status = Job.DONE
+        job.save()
+        audio.request("The wolf walked.")  # audio file was removed meanwhile
+        self.assertEqual(Job.objects.filter(kind="tts").count(), 3)
+
+    def test_failures_in_workers(self):
+        client = tts.TTSClient("http://127.0.0.1:9", max_retries=0)
+        client.breaker = tts.CircuitBreaker(1, 60)
+        with mock.patch.object(tts, "_client", client), mock.patch.object(
+            client, "_post", side_effect=tts.TTSError("TTS API returned 503")
+        ), mock.patch.object(prepare_data, "is_configured", return_value=True):
+            audio.request("The wolf walked.")
+            jobs.run(jobs.claim())  # by a worker, its breaker opens
+
+        # breaker of the web process didn't see the failures
+        self.assertIsNone(audio.request("Hi."))
+        self.assertEqual(Job.objects.filter(kind="tts").count(), 1)
+
+
+class ProgressTests(TransactionTestCase):
+    """
+    Concurrent requests move user through exercises without losing steps.
+    """
+
+    THREADS = 8
+    STEPS = 25
+
+    def setUp(self):
+        self.user = User.objects.create_user("alice", password="password")
+        Memory.objects.create(
+            user=self.user,
+            count=99,
+            current_count=1,
+            pos=["NOUN"],
+            exercise_type="type_in",
+            length=1,
+            skip_length=3,
+        )
+
+    def run_threads(self, target):
+        barrier = threading.Barrier(self.THREADS)
+        results = []
+        errors = []
+
+        def run():
+            try:
+                barrier.wait()
+                results.extend(target())
+            except Exception as e:  # reported in the main thread
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return results
+
+    def test_advance(self):
+        results = self.run_threads(
+            lambda: [Memory.advance(self.user.pk) for _ in range(self.STEPS)]
+        )
+        n_steps = self.THREADS * self.STEPS
+        # every step is counted once and sees its own value
+        self.assertEqual(sorted(results), list(range(2, n_steps + 2)))
+        current_count = Memory.objects.get(user=self.user).current_count
+        self.assertEqual(current_count, n_steps + 1)
+
+    def test_advance_expected(self):
+        # all threads try to move from each exercise, one of them succeeds
+        results = self.run_threads(
+            lambda: [Memory.advance(self.user.pk, i) for i in range(1, self.STEPS)]
+        )
+        self.assertEqual(
+            sorted(result for result in results if result is not None),
+            list(range(2, self.STEPS + 1)),
+        )
+        current_count = Memory.objects.get(user=self.user).current_count
+        self.assertEqual(current_count, self.STEPS)
+
+    def test_other_users(self):
+        bob = User.objects.create_user("bob", password="password")
+        self.assertIsNone(Memory.advance(bob.pk))
+        self.assertEqual(Memory.advance(self.user.pk), 2)
+
+
+@skipUnless(connection.vendor == "postgresql", "EXPLAIN plans are PostgreSQL's")
+@override_settings(STORAGES=STORAGES)
+class QueryPlanTests(TestCase):
+    """
+    Queries of exercise views on a large Exercise table use indexes.
+    Set TEST_EXPLAIN_ROWS to change the table size.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.bulk_create(
+            User(username=f"user{i}", password="!") for i in range(EXPLAIN_USERS)
+        )
+        cls.user = User.objects.create_user("alice", password="password")
+        user_ids = list(User.objects.values_list("pk", flat=True))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO exercises_exercise
+                    (user_id, exercise_type, user_answer, correct_answer, flag)
+                SELECT (%s::bigint[])[1 + i %% %s], 'type_in', 'cat', 'cat',
+                    i %% 3 <> 0
+                FROM generate_series(1, %s) AS i
+                """,
+                [user_ids, len(user_ids), EXPLAIN_ROWS],
+            )
+            cursor.execute(
+                """
+                INSERT INTO exercises_job (user_id, kind, payload, status,
+                    error, created_at)
+                SELECT (%s::bigint[])[1 + i %% %s], 'ingest', '{}', 'done',
+                    '', now()
+                FROM generate_series(1, %s) AS i
+                """,
+                [user_ids, len(user_ids), EXPLAIN_ROWS // 10],
+            )
+            cursor.execute("ANALYZE exercises_exercise, exercises_job")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def assertUsesIndexes(self, queries, tables=("exercises_exercise",)):
+        checked = 0
+        with connection.cursor() as cursor:
+            for query in queries:
+                sql = query["sql"]
+                if not sql.startswith(("SELECT", "UPDATE", "DELETE")):
+                    continue
+                if not any(table in sql for table in tables):
+                    continue
+                cursor.execute(f"EXPLAIN {sql}")
+                plan = "\n".join(row[0] for row in cursor.fetchall())
+                for table in tables:
+                    self.assertIsNone(re.search(rf"Seq Scan on {table}\b", plan), sql)
+                checked += 1
+        self.assertGreater(checked, 0)
+
+    def test_backfill(self):
+        with CaptureQueriesContext(connection) as context:
+            ExerciseStats.rebuild(self.user.pk)
+        self.assertUsesIndexes(context.captured_queries)
+
+    def test_stats_delete(self):
+        add_answers(self.user, 10)
+        with CaptureQueriesContext(connection) as context:
+            self.client.post(reverse("exercise_stats_delete"))
+        self.assertUsesIndexes(context.captured_queries)
+
+    def test_active_jobs(self):
+        with CaptureQueriesContext(connection) as context:
+            jobs.get_active("ingest", self.user.pk)
+        self.assertUsesIndexes(context.captured_queries, tables=["exercises_job"])
+
+
+SENTENCES = [
+    "Once upon a time there was a lovely little girl who was loved by everyone.",
+    "The grandmother loved her most of all and gave her a little red cap.",
+    "She wanted to wear nothing else, so she was called Little Red Cap.",
+    "One day her mother said to her: take this cake and the bottle of wine.",
+    "The wolf walked beside her and talked about the pretty flowers.",
+    "Hi.",
+]
+
+
+def tag(doc):
+    """
+    Stand-in for the tagger of the spaCy model: synthetic parts of speech,
+    tags and lemmas, good enough for exercise generators.
+    """
+
+    for token in doc:
+        word = token.lower_
+        if token.is_punct:
+            token.pos_, token.tag_ = "PUNCT", "."
+        elif word in ("a", "an", "the"):
+            token.pos_, token.tag_ = "DET", "DT"
+        elif word in ("is", "was", "are"):
+            token.pos_, token.tag_ = "AUX", "VBZ"
+        elif word.endswith("ed"):
+            token.pos_, token.tag_ = "VERB", "VBD"
+            word = word[:-2]
+        elif word.endswith("y"):
+            token.pos_, token.tag_ = "ADJ", "JJ"
+        else:
+            token.pos_, token.tag_ = "NOUN", "NN"
+        token.lemma_ = word
+    return doc
+
+
+def make_nlp():
+    """
+    Blank English pipeline with the synthetic tagger.
+    """
+
+    import spacy
+    from spacy.language import Language
+
+    if not Language.has_factory("test_tagger"):
+        Language.component("test_tagger", func=tag)
+    nlp = spacy.blank("en")
+    nlp.add_pipe("test_tagger")
+    return nlp
+
+
+class ThreadSafetyTests(SimpleTestCase):
+    """
+    Exercises generated in parallel threads are the same as generated
+    one by one with the same seeds.
+    Synthetic pipeline and vectors stand in for the spaCy and GloVe models.
+    """
+
+    THREADS = 8
+    GENERATIONS = 400
+    EXERCISE_TYPES = {  # skip lengths
+        "type_in": 1,
+        "multiple_choice": 1,
+        "word_order": 3,
+        "blanks": 3,
+        "all_choices": 1,
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from gensim.models import KeyedVectors
+
+        nlp = make_nlp()
+        words = sorted({token.lower_ for doc in nlp.pipe(SENTENCES) for token in doc})
+        vectors = KeyedVectors(16)
+        vectors.add_vectors(words, np.random.RandomState(0).rand(len(words), 16))
+        vectors.fill_norms()
+        models = {"nlp": nlp, "vectors": vectors, "synonym_table": None}
+        cls.patches = [
+            mock.patch.dict(registry._models, models),
+            # generation takes longer in a busy thread, but it shouldn't
+            # fall back to another exercise type because of that
+            mock.patch.object(prepare_data, "TIME_BUDGET", 600),
+        ]
+        for patch in cls.patches:
+            patch.start()
+
+        cls.directory = tempfile.mkdtemp()
+        cls.text_path = os.path.join(cls.directory, "text.txt")
+        cls.text = " ".join(SENTENCES * 30)
+        with open(cls.text_path, "w") as f:
+            f.write(cls.text)
+        prepare_data.load_text(cls.text_path, "stress")
+
+    @classmethod
+    def tearDownClass(cls):
+        prepare_data.remove_data(cls.text_path, "stress")
+        shutil.rmtree(cls.directory)
+        synonyms.cache.clear()
+        for patch in cls.patches:
+            patch.stop()
+        super().tearDownClass()
+
+    def generate(self, seed):
+        types = list(self.EXERCISE_TYPES)
+        exercise_type = types[seed % len(types)]
+        return prepare_data.prepare_exercises(
+            self.text_path,
+            seed=seed,
+            user="stress",
+            exercise_type=exercise_type,
+            pos=["NOUN", "VERB", "ADJ"],
+            length=1 + seed % 2,
+            skip_length=self.EXERCISE_TYPES[exercise_type],
+        )
+
+    def assertValid(self, exercise):
+        answer = exercise["correct_answer"]
+        self.assertTrue(answer)
+        if exercise["exercise_type"] in ("type_in", "multiple_choice"):
+            # exercise is made of consecutive sentences of the text
+            text = exercise["begin"] + answer + exercise["end"]
+            self.assertIn(re.sub(r"\s", "", text), re.sub(r"\s", "", self.text))
+        if exercise["exercise_type"] in ("multiple_choice", "word_order"):
+            self.assertIn((answer, answer), exercise["options"])
+        if exercise["exercise_type"] == "blanks":
+            options = exercise["options"].split(", ")
+            for word in answer.split(", "):
+                self.assertIn(word, options)
+
+    def test_parallel_generation(self):
+        seeds = range(self.GENERATIONS)
+        expected = [self.generate(seed) for seed in seeds]
+        for exercise in expected:
+            self.assertValid(exercise)
+        # exercises of all types were generated, not only their fallbacks
+        generated_types = {exercise["exercise_type"] for exercise in expected}
+        self.assertEqual(generated_types, set(self.EXERCISE_TYPES) - {"all_choices"})
+
+        with ThreadPoolExecutor(max_workers=self.THREADS) as executor:
+            results = list(executor.map(self.generate, seeds))
+        self.assertEqual(results, expected)
+
+    def test_parallel_loading(self):
+        # texts are dropped from cache and loaded again while generating
+        def forget_and_generate(seed):
+            if seed % 10 == 0:
+                prepare_data.forget_text(self.text_path, "stress")
+            return self.generate(seed)
+
+        expected = [self.generate(seed) for seed in range(100)]
+        with ThreadPoolExecutor(max_workers=self.THREADS) as executor:
+            results = list(executor.map(forget_and_generate, range(100)))
+        self.assertEqual(results, expected)
+
+
+class NLPServerTests(ThreadSafetyTests):
+    """
+    Same exercises are generated by the NLP server as in-process,
+    by any number of client threads.
+    """
+
+    GENERATIONS = 100
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.socket_path = os.path.join(cls.directory, "nlp.sock")
+        cls.start_server()
+        cls.nlp_client = nlp_server.NLPClient(cls.socket_path, timeout=60)
+
+    @classmethod
+    def start_server(cls):
+        cls.server = nlp_server.NLPServer(cls.socket_path, threads=4)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def stop_server(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stop_server()
+        super().tearDownClass()
+
+    def generate(self, seed):
+        types = list(self.EXERCISE_TYPES)
+        exercise_type = types[seed % len(types)]
+        return self.nlp_client.prepare_exercises(
+            self.text_path,
+            seed=seed,
+            user="stress",
+            exercise_type=exercise_type,
+            pos=["NOUN", "VERB", "ADJ"],
+            length=1 + seed % 2,
+            skip_length=self.EXERCISE_TYPES[exercise_type],
+        )
+
+    def test_same_as_in_process(self):
+        for seed in range(20):
+            self.assertEqual(
+                self.generate(seed), ThreadSafetyTests.generate(self, seed)
+            )
+
+    def test_operations(self):
+        self.assertTrue(self.nlp_client.ping())
+        self.assertIsNone(self.nlp_client.load_text(self.text_path, "stress"))
+        [tokens] = self.nlp_client.tag(["The wolf walked."])
+        self.assertEqual(tokens[1], ["wolf", " ", "NOUN", "NN", "wolf"])
+        expected = [
+            list(words) if words else words
+            for words in synonyms.synonyms_for_many(["wolf"])
+        ]
+        self.assertEqual(self.nlp_client.synonyms(["wolf"]), expected)
+        self.assertEqual(self.nlp_client.inflect([("walk", "VERB", "VBZ")]), ["walks"])
+
+    def test_errors(self):
+        with self.assertRaises(NoSentencesError):
+            self.nlp_client.prepare_exercises(
+                self.text_path,
+                user="stress",
+                exercise_type="type_in",
+                pos=["NOUN"],
+                length=10**6,
+                skip_length=1,
+            )
+        with self.assertRaises(FileNotFoundError):
+            self.nlp_client.load_text(os.path.join(self.directory, "none.txt"), "x")
+        with self.assertRaises(nlp_server.NLPServerError):
+            self.nlp_client.call(255)
+        # connection is still usable after errors
+        self.assertTrue(self.nlp_client.ping())
+
+    def test_socket_mode(self):
+        mode = os.stat(self.socket_path).st_mode & 0o777
+        self.assertEqual(mode, nlp_server.NLP_SERVER_SOCKET_MODE)
+        self.assertFalse(mode & 0o007)
+
+    def test_server_restart(self):
+        self.assertTrue(self.nlp_client.ping())
+        self.stop_server()
+        try:
+            with self.assertRaises(nlp_server.NLPServerError):
+                self.nlp_client.ping()
+        finally:
+            self.start_server()
+        # connection closed by the old server is replaced
+        self.assertTrue(self.nlp_client.ping())
+        self.assertTrue(self.nlp_client.ping())
+
+
+class PipelinePoolTests(SimpleTestCase):
+    def test_handles_are_not_shared(self):
+        loaded = []
+        in_use = set()
+        errors = []
+        lock = threading.Lock()
+
+        def load(i):
+            loaded.append(i)
+            return object()
+
+        pool = PipelinePool(3, load=load)
+
+        def use(_):
+            with pool.handle() as nlp:
+                with lock:
+                    if nlp in in_use:
+                        errors.append(nlp)
+                    in_use.add(nlp)
+                time.sleep(0.001)
+                with lock:
+                    in_use.discard(nlp)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(use, range(200)))
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(loaded), [0, 1, 2])
+
+    def test_failed_load(self):
+        pool = PipelinePool(1, load=mock.Mock(side_effect=[OSError, "nlp"]))
+        with self.assertRaises(OSError):
+            with pool.handle():
+                pass
+        with pool.handle() as nlp:
+            self.assertEqual(nlp, "nlp")
+
+
+class WindowSamplerTests(SimpleTestCase):
+    """
+    Valid windows are the ones the exercise generators could use before
+    windows were sampled from the index: long enough joined sentences
+    with enough tokens selected by select_skippable_tokens.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        nlp = make_nlp()
+        sentences = SENTENCES + ["Go.", "It was very pretty.", "Hi, wolf."]
+        cls.docs = list(nlp.pipe(sentences * 2))
+        cls.sampler = WindowSampler(TextIndex.from_docs(cls.docs))
+
+    def select_windows(self, length, pos, skip_length, multiple_skips):
+        from spacy.tokens import Doc
+
+        windows = []
+        for start in range(len(self.docs) - length + 1):
+            doc = Doc.from_docs(
+                self.docs[start : start + length], ensure_whitespace=True
+            )
+            _, selected = select_skippable_tokens(doc, skip_length, pos)
+            required = skip_length if multiple_skips else 1
+            if len(doc.text.split(" ")) > 3 and len(selected or []) >= required:
+                windows.append(start)
+        return windows
+
+    def test_same_as_selection(self):
+        for length in (1, 2, 3):
+            for pos in (["NOUN"], ["VERB", "ADJ"], ["DET"], ["ALL"]):
+                for skip_length in (1, 2, 3):
+                    for multiple_skips in (False, True):
+                        args = (length, pos, skip_length, multiple_skips)
+                        self.assertEqual(
+                            self.sampler.valid_windows(*args).tolist(),
+                            self.select_windows(*args),
+                            args,
+                        )
+
+    def test_sample(self):
+        rng = random.Random(0)
+        windows = self.sampler.valid_windows(2, ["ADJ"], 1, False).tolist()
+        self.assertTrue(windows)
+        for _ in range(20):
+            self.assertIn(self.sampler.sample(2, ["ADJ"], 1, rng=rng), windows)
+        self.assertIsNone(self.sampler.sample(1, ["X"], 1, rng=rng))
+
+    def assertSameWindows(self, sampler):
+        for args in ((1, ["NOUN"], 1, False), (2, ["VERB", "ADJ"], 2, True)):
+            self.assertEqual(
+                sampler.valid_windows(*args).tolist(),
+                self.sampler.valid_windows(*args).tolist(),
+            )
+
+    def test_stored_index(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "text.index")
+        self.sampler.index.to_disk(path)
+
+        index = TextIndex.from_disk(path)
+        self.assertIsInstance(index.arrays, ArrayStore)
+        self.assertEqual(index.inflections, self.sampler.index.inflections)
+        self.assertSameWindows(WindowSampler(index))
+
+    def test_json_index(self):
+        # index files of older versions
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "text.index.json")
+        pos = {}
+        for i, doc in enumerate(self.docs):
+            for token in doc:
+                pos.setdefault(token.pos_, []).append([i, token.i])
+        data = {
+            "pos": pos,
+            "n_words": [len(doc.text.split(" ")) for doc in self.docs],
+            "n_tokens": [len(doc) for doc in self.docs],
+            "n_non_punct": [sum(not t.is_punct for t in doc) for doc in self.docs],
+        }
+        with open(path, "w") as f:
+            json.dump(data, f)
+        self.assertSameWindows(WindowSampler(TextIndex.from_json(path)))
+
+
+class PrefetchTests(SimpleTestCase):
+    """
+    Every pre-generated exercise is served once, however requests
+    and refills of a queue interleave.
+    """
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        cache = {**settings.CACHES["exercises"], "LOCATION": directory}
+        overrides = override_settings(
+            CACHES={"default": cache, "exercises": cache},
+            EXERCISES_PREFETCH_COUNT=5,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.ids = itertools.count()
+        self.generated = []
+        self.threads = set()
+        generate = mock.patch.object(prefetch, "generate", side_effect=self.generate)
+        generate.start()
+        self.addCleanup(generate.stop)
+
+    def generate(self, filepath, kwargs):
+        exercise = {"id": next(self.ids)}
+        self.generated.append(exercise["id"])
+        self.threads.add(threading.current_thread().name)
+        return exercise
+
+    def pop_all(self, version="1:1", user_pk=1):
+        exercises = []
+        while True:
+            exercise = prefetch.pop(user_pk, version)
+            if exercise is None:
+                return exercises
+            exercises.append(exercise["id"])
+
+    def test_concurrent_pops(self):
+        prefetch.refill(1, "1:1", "", {})
+        barrier = threading.Barrier(8)
+
+        def pop(_):
+            barrier.wait()
+            return prefetch.pop(1, "1:1")
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            served = [e["id"] for e in executor.map(pop, range(8)) if e]
+        self.assertEqual(sorted(served), list(range(5)))
+
+    def test_concurrent_refills(self):
+        served = []
+
+        def serve(_):
+            for _ in range(20):
+                prefetch.refill(1, "1:1", "", {})
+                exercise = prefetch.pop(1, "1:1")
+                if exercise is not None:
+                    served.append(exercise["id"])
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(serve, range(8)))
+        served.extend(self.pop_all())
+        self.assertEqual(len(served), len(set(served)))
+        self.assertGreaterEqual(len(served), 160)
+
+    def test_pop_while_refilling(self):
+        prefetch.refill(1, "1:1", "", {})
+        served = [prefetch.pop(1, "1:1")["id"]]
+
+        def generate_and_pop(filepath, kwargs):
+            if len(served) == 1:  # request served while generating
+                served.append(prefetch.pop(1, "1:1")["id"])
+            return self.generate(filepath, kwargs)
+
+        prefetch.generate.side_effect = generate_and_pop
+        prefetch.refill(1, "1:1", "", {})
+        served.extend(self.pop_all())
+        self.assertEqual(sorted(served), self.generated)
+
+    def test_invalidate(self):
+        prefetch.refill(1, "1:1", "", {})
+        prefetch.invalidate(1)
+        self.assertEqual(self.pop_all(), [])
+
+        prefetch.refill(1, "1:1", "", {})
+        self.assertEqual(self.pop_all("1:2"), [])
+        prefetch.refill(1, "1:2", "", {})
+        self.assertEqual(sorted(self.pop_all("1:2")), list(range(10, 15)))
+
+    def test_refill_async(self):
+        users = range(20)
+        for user_pk in users:
+            prefetch.refill_async(user_pk, "1:1", "", {})
+        deadline = time.monotonic() + 10
+        while prefetch._refilling and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        served = [e for user_pk in users for e in self.pop_all(user_pk=user_pk)]
+        self.assertEqual(sorted(served), list(range(100)))
+        # refills wait for threads of the background pool
+        self.assertLessEqual(len(self.threads), settings.BACKGROUND_THREADS)
+        self.assertTrue(all(name.startswith("background") for name in self.threads))
+
+    @override_settings(USE_JOB_WORKERS=True)
+    def test_no_job_for_full_queue(self):
+        prefetch.refill(1, "1:1", "", {})
+        with mock.patch.object(prefetch.jobs, "enqueue") as enqueue:
+            prefetch.refill_async(1, "1:1", "", {})
+            enqueue.assert_not_called()
+            prefetch.pop(1, "1:1")
+            prefetch.refill_async(1, "1:1", "", {})
+            enqueue.assert_called_once()
+
+    def test_queues_of_many_users(self):
+        # queues of other users aren't culled from the cache
+        users = range(60)  # 11 entries each
+        for user_pk in users:
+            prefetch.refill(user_pk, "1:1", "", {})
+        served = [e for user_pk in users for e in self.pop_all(user_pk=user_pk)]
+        self.assertEqual(sorted(served), list(range(300)))
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    RESET_TIMEOUT = 0.05
+
+    def setUp(self):
+        self.breaker = tts.CircuitBreaker(3, self.RESET_TIMEOUT)
+
+    def open(self):
+        for _ in range(3):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record_failure()
+        self.assertTrue(self.breaker.is_open)
+        self.assertFalse(self.breaker.allow())
+
+    def test_opens_after_consecutive_failures(self):
+        for _ in range(2):
+            self.breaker.record_failure()
+        self.breaker.record_success()  # failures are counted from zero again
+        for _ in range(2):
+            self.breaker.record_failure()
+        self.assertFalse(self.breaker.is_open)
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.is_open)
+        self.assertFalse(self.breaker.allow())
+
+    def test_trial_success_closes(self):
+        self.open()
+        time.sleep(self.RESET_TIMEOUT)
+        self.assertFalse(self.breaker.is_open)
+        self.assertTrue(self.breaker.allow())  # trial call
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertTrue(self.breaker.allow())
+        self.assertTrue(self.breaker.allow())
+
+    def test_trial_failure_opens(self):
+        self.open()
+        time.sleep(self.RESET_TIMEOUT)
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.is_open)
+        self.assertFalse(self.breaker.allow())
+        time.sleep(self.RESET_TIMEOUT)
+        self.assertTrue(self.breaker.allow())
+
+    def test_trial_without_result(self):
+        self.open()
+        time.sleep(self.RESET_TIMEOUT)
+        self.assertTrue(self.breaker.allow())
+
+        # only the thread making the trial call ends it
+        thread = threading.Thread(target=self.breaker.end_trial)
+        thread.start()
+        thread.join()
+        self.assertFalse(self.breaker.allow())
+
+        self.breaker.end_trial()
+        self.assertTrue(self.breaker.allow())
+
+
+class TTSClientTests(SimpleTestCase):
+    def setUp(self):
+        self.client = tts.TTSClient(
+            "http://tts.invalid", max_concurrency=1, deadline=0.2, max_retries=1
+        )
+        self.client.breaker = tts.CircuitBreaker(2, 0.05)
+        self.post = mock.patch.object(self.client.session, "post").start()
+        self.addCleanup(mock.patch.stopall)
+        mock.patch.object(tts, "BACKOFF", 0.001).start()
+
+    def response(self, status_code=200):
+        response = requests.Response()
+        response.status_code = status_code
+        response._content = b"RIFF"
+        return response
+
+    def test_retries(self):
+        self.post.side_effect = [self.response(503), self.response()]
+        self.assertEqual(self.client.synthesize("Hi."), b"RIFF")
+        self.assertEqual(self.post.call_count, 2)
+        self.assertEqual(self.client.breaker.failures, 0)
+
+    def test_request_errors(self):
+        self.post.side_effect = requests.exceptions.ChunkedEncodingError
+        for _ in range(2):
+            with self.assertRaises(tts.TTSError):
+                self.client.synthesize("Hi.")
+        self.assertTrue(self.client.breaker.is_open)
+
+        # the trial call fails the same way, breaker is open again
+        time.sleep(0.05)
+        with self.assertRaises(tts.TTSError):
+            self.client.synthesize("Hi.")
+        self.assertTrue(self.client.breaker.is_open)
+
+        time.sleep(0.05)
+        self.post.side_effect = None
+        self.post.return_value = self.response()
+        self.assertEqual(self.client.synthesize("Hi."), b"RIFF")
+        self.assertFalse(self.client.breaker.is_open)
+
+    def test_trial_ends_on_busy_client(self):
+        self.post.side_effect = requests.ConnectionError
+        for _ in range(2):
+            with self.assertRaises(tts.TTSError):
+                self.client.synthesize("Hi.")
+        time.sleep(0.05)
+
+        # trial call can't get a connection: it ends without a result
+        self.client._semaphore.acquire()
+        with self.assertRaises(tts.TTSError):
+            self.client.synthesize("Hi.")
+        self.client._semaphore.release()
+        self.assertFalse(self.client.breaker.is_open)
+
+        self.post.side_effect = None
+        self.post.return_value = self.response()
+        self.assertEqual(self.client.synthesize("Hi."), b"RIFF")
+
+
+class StoreTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "store")
+
+    def test_sentences(self):
+        # lengths around the 8 byte padding of records
+        sentences = ["a" * n for n in range(1, 18)] + ["Grüße, Rotkäppchen!"]
+        SentenceStore.write(self.path, iter(sentences))
+        store = SentenceStore(self.path)
+
+        self.assertEqual(len(store), len(sentences))
+        self.assertEqual(list(store), sentences)
+        self.assertEqual(store[-1], sentences[-1])
+        self.assertEqual(store[3:6], sentences[3:6])
+        with self.assertRaises(IndexError):
+            store[len(sentences)]
+
+    def test_empty(self):
+        SentenceStore.write(self.path, [])
+        self.assertEqual(list(SentenceStore(self.path)), [])
+
+    def test_sentences_with_word_counts(self):
+        # stores written before word counts were kept in the text index only
+        with RecordStore.create(self.path) as add:
+            for sentence in SENTENCES:
+                add(WORD_COUNT.pack(len(sentence.split(" "))) + sentence.encode())
+        self.assertEqual(list(SentenceStore(self.path)), SENTENCES)
+
+    def test_arrays(self):
+        arrays = {
+            "offsets": np.arange(5, dtype="<u4"),
+            "empty": np.zeros(0, dtype="<i8"),
+            "sums": np.array([1, 3, 2**40], dtype="<i8"),
+        }
+        ArrayStore.write(self.path, arrays, {"version": 1})
+        store = ArrayStore(self.path)
+
+        self.assertEqual(store.keys(), list(arrays))
+        self.assertEqual(store.meta["version"], 1)
+        for name, values in arrays.items():
+            self.assertEqual(store.get(name).dtype, values.dtype)
+            self.assertEqual(store.get(name).tolist(), values.tolist())
+        self.assertIsNone(store.get("missing"))
+
+    def test_text_size(self):
+        # texts are memory mapped, their cached size doesn't grow with length
+        nlp = make_nlp()
+        sizes = []
+        for n in (1, 20):
+            docs = list(nlp.pipe(SENTENCES * n))
+            with DocStore.writer(f"{self.path}{n}") as add:
+                for doc in docs:
+                    add(doc)
+            text = ParsedText(DocStore(f"{self.path}{n}"), TextIndex.from_docs(docs))
+            sizes.append(text.nbytes)
+        self.assertEqual(sizes[0], sizes[1])
+
+    def test_concurrent_writes(self):
+        # threads writing the same store don't share a temporary file
+        def write(n):
+            SentenceStore.write(self.path, [f"Sentence {n}."] * 5000)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(write, range(8)))
+        self.assertEqual(len(set(SentenceStore(self.path))), 1)
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), ["store"])
+
+    def test_not_a_store(self):
+        with open(self.path, "wb") as f:
+            f.write(b"\0" * 64)
+        with self.assertRaises(ValueError):
+            SentenceStore(self.path)
+
+    def test_docs(self):
+        docs = list(make_nlp().pipe(SENTENCES))
+        with DocStore.writer(self.path) as add:
+            for doc in docs:
+                add(doc)
+        text = ParsedText(DocStore(self.path), TextIndex.from_docs(docs))
+
+        self.assertEqual(len(text), len(docs))
+        for doc, restored in zip(docs, text):
+            self.assertEqual(restored.text, doc.text)
+            for attr in ("text", "whitespace_", "pos_", "tag_", "lemma_"):
+                self.assertEqual(
+                    [getattr(token, attr) for token in restored],
+                    [getattr(token, attr) for token in doc],
+                )
+
+
+class LRUCacheTests(SimpleTestCase):
+    def test_size_bound(self):
+        cache = LRUCache(10, getsize=len)
+        cache["a"] = "x" * 4
+        cache["b"] = "x" * 4
+        cache.get("a")
+        cache["c"] = "x" * 4  # least recently used "b" is evicted
+        self.assertEqual(("a" in cache, "b" in cache, "c" in cache), (True, False, True))
+        self.assertEqual(cache.info().currsize, 8)
+
+    def test_too_large(self):
+        cache = LRUCache(10, getsize=len)
+        cache["a"] = "x"
+        with self.assertLogs("text_processing.cache", "WARNING"):
+            cache["a"] = "x" * 11
+        self.assertNotIn("a", cache)
+        self.assertEqual(cache.info().currsize, 0)
+
+
+class IngestTests(SimpleTestCase):
+    """
+    Texts read and split in chunks split into the same sentences
+    as whole texts.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        paragraphs = [" ".join(SENTENCES[: i % 6 + 1]) for i in range(40)]
+        cls.text = "\n".join(paragraphs) + "\n" + " ".join(SENTENCES * 5)
+
+    def test_chunks(self):
+        for chunk_size in (50, 333, 1000):
+            chunks = list(ingest.split_chunks(self.text, chunk_size))
+            self.assertGreater(len(chunks), 1)
+            self.assertEqual(
+                list(ingest.read_chunks(io.StringIO(self.text), chunk_size)), chunks
+            )
+            # chunks are cut at line breaks or sentence ends, if there are any
+            for chunk in chunks[:-1]:
+                self.assertLessEqual(len(chunk), chunk_size)
+            self.assertEqual(
+                re.sub(r"\s", "", "".join(chunks)), re.sub(r"\s", "", self.text)
+            )
+
+    def test_sentences(self):
+        expected = ingest.split_sentences(self.text)
+        for processes in (1, 2):
+            with mock.patch.object(ingest, "PROCESSES", processes):
+                chunks = ingest.read_chunks(io.StringIO(self.text), 1000)
+                self.assertEqual(list(ingest.split_chunked(chunks)), expected)
+
+    def test_file(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".txt") as f:
+            f.write(self.text)
+            f.flush()
+            sentences = list(ingest.split_file(f.name))
+        self.assertEqual(sentences, ingest.split_sentences(self.text))
@@ -0,0 +1,90 @@
+"""
+Uploaded texts are stored once per content. Text entry keeps the file
+under texts/{content hash}.txt, sentences and parsed text are stored next
+to it under the same name (see text_processing.prepare_data), so a text
+uploaded by several users is stored and parsed once.
+
+File entries of users reference Text entries. When the last reference
+is released, the text and all its data are removed.
+"""
+
+import hashlib
+from typing import Union
+
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+
+from text_processing.prepare_data import remove_data
+
+from .models import File, Text
+
+
+def hash_file(file: UploadedFile) -> str:
+    content_hash = hashlib.sha256()
+    for chunk in file.chunks():
+        content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+def acquire(file: UploadedFile, content_hash: Union[str, None] = None) -> Text:
+    """
+    Returns Text entry for the uploaded file, storing the file if it's
+    a new text. Pass content_hash if it was computed on upload.
+    Call it in the transaction saving File entry: Text stays locked until
+    the transaction ends, so it's not removed before it's referenced.
+    """
+
+    content_hash = content_hash or hash_file(file)
+    # concurrent uploads of the same text wait for the first one here
+    text, created = Text.objects.select_for_update().get_or_create(
+        content_hash=content_hash
+    )
+    if created:
+        text.file.save(f"{content_hash}.txt", file)
+    return text
+
+
+def _remove(text: Text) -> None:
+    remove_data(text.file.path, text.content_hash)
+    text.file.delete(save=False)
+    text.delete()
+
+
+def release(file: File, delete: bool = True) -> None:
+    """
+    Deletes File entry, removes its text if no other files reference it.
+    Files uploaded before texts were shared are removed along with their data.
+    Pass delete=False if the entry was updated to reference another text,
+    `file` being its previous state: only the previous text is released.
+    """
+
+    if file.text_id is None:
+        remove_data(file.file.path, file.data_name)
+        file.file.delete(save=False)
+        if delete:
+            file.delete()
+        return
+
+    with transaction.atomic():
+        # lock the text, so it's not removed while being acquired
+        text = Text.objects.select_for_update().get(pk=file.text_id)
+        if delete:
+            file.delete()
+        if not text.files.exists():
+            _remove(text)
+
+
+def remove_unused() -> int:
+    """
+    Removes texts without files, e.g. left after users were deleted.
+    Returns number of removed texts.
+    """
+
+    removed = 0
+    for text in Text.objects.filter(files__isnull=True):
+        with transaction.atomic():
+            text = Text.objects.select_for_update().filter(pk=text.pk).first()
+            if text is not None and not text.files.exists():
+                _remove(text)
+                removed += 1
+    return removed
@@ -7,6 +7,8 @@ urlpatterns = [
     path("upload/", views.ExerciseUploadView.as_view(), name="exercise_upload"),
     path("create/", views.ExerciseCreateView.as_view(), name="exercise_create"),
     path("stats/", views.ExerciseStatsView.as_view(), name="exercise_stats"),
+    path("jobs/<int:pk>/", views.JobStatusView.as_view(), name="job_status"),
+    path("audio/<slug:key>/", views.AudioStatusView.as_view(), name="audio_status"),
     path(
         "stats/delete/",
         views.ExerciseStatsDeleteView.as_view(),
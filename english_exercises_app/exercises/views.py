@@ -1,16 +1,23 @@
 from typing import Union
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib import messages
+from django.contrib.auth import get_user
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.exceptions import NON_FIELD_ERRORS
+from django.db import transaction
+from django.http import JsonResponse
 from django.http.request import QueryDict
-from django.shortcuts import redirect, render
+from django.shortcuts import get_object_or_404, redirect, render
 from django.template.defaulttags import register
 from django.urls import reverse_lazy
 from django.utils.translation import gettext_lazy as _
-from django.views.generic.base import TemplateView
+from django.views.generic.base import TemplateView, View
 
-from text_processing.prepare_data import load_audio, prepare_exercises
+from text_processing.exercises import GenerationError
 
+from . import audio, executor, jobs, prefetch
 from .forms import (
     BlanksExercise,
     FileForm,
@@ -18,7 +25,7 @@ from .forms import (
     MultipleChoiceExercise,
     TypeInExercise,
 )
-from .models import AudioFile, Exercise, File, Memory
+from .models import Exercise, ExerciseStats, File, Job, Memory
 
 
 @register.filter(name="split")
@@ -26,25 +33,56 @@ def split(value, key):
     return value.split(key)
 
 
-class ExerciseUploadView(LoginRequiredMixin, TemplateView):
+class AsyncLoginRequiredMixin(LoginRequiredMixin):
+    """
+    LoginRequiredMixin for views with async handlers.
+    request.user is loaded from the database lazily, which is not allowed
+    in async code, so it's loaded in advance.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        request.user = await sync_to_async(get_user)(request)
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        return await View.dispatch(self, request, *args, **kwargs)
+
+
+class ExerciseUploadView(AsyncLoginRequiredMixin, TemplateView):
     """
     This class defines logic of file upload.
     """
 
     login_url = reverse_lazy("user_login")
 
-    def get(self, request):
+    async def get(self, request):
         form = FileForm()
         return render(request, "exercises/upload.html", {"form": form})
 
-    def post(self, request):
+    async def post(self, request):
+        # reading the upload, and parsing the text unless it's done
+        # by job workers, block, so they run in the executor
+        return await executor.run(self.upload, request)
+
+    def upload(self, request):
         form = FileForm(request.POST, request.FILES)
 
         if form.is_valid():
-            form.save(user=request.user)
+            # computed by ContentHashUploadHandler while receiving the file
+            content_hash = getattr(request, "upload_hashes", {}).get("file")
+            form.save(user=request.user, content_hash=content_hash)
             messages.success(request, _("File uploaded successfully!"))
             return redirect("exercise_create")
 
+        elif getattr(request, "upload_too_large", False) or form.has_error(
+            NON_FIELD_ERRORS, code="too_large"
+        ):
+            messages.warning(
+                request,
+                _("File is too large, maximum size is %(size)s MB")
+                % {"size": settings.MAX_UPLOAD_SIZE // 2**20},
+            )
+            return redirect("exercise_upload")
+
         else:
             messages.warning(
                 request, _("Something went wrong. Please check file format")
@@ -75,7 +113,7 @@ class ExerciseCreateView(LoginRequiredMixin, TemplateView):
             return redirect("exercise_create")
 
 
-class ExerciseShowView(LoginRequiredMixin, TemplateView):
+class ExerciseShowView(AsyncLoginRequiredMixin, TemplateView):
     """
     This class shows exercises
     and adds user input to database to maintain stats.
@@ -83,40 +121,20 @@ class ExerciseShowView(LoginRequiredMixin, TemplateView):
 
     login_url = reverse_lazy("user_login")
 
-    def upload_audio(self, files_path: str, data: dict) -> Union[None, AudioFile]:
+    def get_audio(self, data: dict) -> Union[None, dict]:
         # generate audio only if requested. don't generate audio for blanks ex.
         if not data.get("add_audio") or data.get("exercise_type") == "blanks":
             return
 
-        current_user = self.request.user
-        audio_file_name = current_user.username
-        text_for_audio = data["begin"] + data["correct_answer"] + data["end"]
-
-        audio = AudioFile.objects.filter(user=current_user).first()
-        if audio is not None:
-            audio.delete()
-
-        # load text to .wav file
-        # return True if an actual API key for huggingface was provided
-        is_loaded = load_audio(files_path, audio_file_name, text_for_audio)
-        if not is_loaded:
+        # audio is generated in background, page polls for it if not ready
+        key = audio.request(data["begin"] + data["correct_answer"] + data["end"])
+        if key is None:  # no API key for huggingface was provided
             return
+        return {"key": key, "url": audio.get_url(key), "ready": audio.is_ready(key)}
 
-        # add .wav file to Django FileForm
-        audio = AudioFile()
-        audio.file.name = f"{audio_file_name}.wav"
-        audio.user = current_user
-        audio.save()
-        return AudioFile.objects.filter(user=current_user).first()
-
-    def calculate_user_score(self, request, params):
-        subquery = Exercise.objects.filter(user=request.user).order_by("-pk")[
-            : params.count
-        ]
-        query = (
-            Exercise.objects.filter(pk__in=subquery).order_by("pk").filter(flag=True)
-        )
-        score = query.count()
+    async def calculate_user_score(self, request, params):
+        stats = await ExerciseStats.objects.filter(user=request.user).afirst()
+        score = stats.recent_correct(params.count) if stats else 0
 
         messages.success(
             request,
@@ -166,9 +184,11 @@ class ExerciseShowView(LoginRequiredMixin, TemplateView):
         form.fields["current_count"].initial = data["current_count"]
         return form
 
-    def get(self, request):
-        file = File.objects.filter(user=request.user).first()
-        params = Memory.objects.filter(user=request.user).first()
+    async def get(self, request):
+        # data_name of the file needs its text or user
+        file = File.objects.select_related("text", "user").filter(user=request.user)
+        file = await file.afirst()
+        params = await Memory.objects.filter(user=request.user).afirst()
 
         if not file:
             messages.error(request, _("Please upload a file."))
@@ -178,48 +198,74 @@ class ExerciseShowView(LoginRequiredMixin, TemplateView):
             return redirect("exercise_create")
 
         if params.current_count == params.count:
-            self.calculate_user_score(request, params)
-
-        if request.GET.get("next") == "true":
-            params.current_count += 1
-            params.save()
+            await self.calculate_user_score(request, params)
+
+        # uploaded text is being processed by a job worker
+        job = await sync_to_async(jobs.get_active)("ingest", request.user.pk)
+        if job is not None:
+            return render(request, "exercises/processing.html", {"job": job})
+
+        # "next" is the exercise to move from, or "true" to move from any
+        next_param = request.GET.get("next")
+        if next_param:
+            expected = int(next_param) if next_param.isdigit() else None
+            current_count = await sync_to_async(Memory.advance)(
+                request.user.pk, expected
+            )
+            if current_count is None:  # moved by another request already
+                await params.arefresh_from_db(fields=["current_count"])
+            else:
+                params.current_count = current_count
 
         # prepare exercises
+        # refer to Memory model for details on kwargs
+        kwargs = {
+            field.name: getattr(params, field.attname)  # fmt: skip
+            for field in params._meta.fields
+        }
+        kwargs["user"] = file.data_name  # name of parsed text files
+        filepath = file.file.path
+        version = prefetch.get_version(file, params)
         try:
-            # refer to Memory model for details on kwargs
-            kwargs = {
-                field.name: getattr(params, field.name)  # fmt: skip
-                for field in params._meta.fields
-            }
-            filepath = file.file.path
-            data = prepare_exercises(filepath, **kwargs)
+            data = await sync_to_async(prefetch.pop)(request.user.pk, version)
+            if data is None:
+                # CPU-bound, runs in the executor
+                data = await executor.run(prefetch.generate, filepath, kwargs)
         except FileNotFoundError:
             messages.warning(request, _("Please upload a file"))
             return redirect("exercise_upload")
+        except GenerationError:
+            messages.error(
+                request,
+                _("Can't make exercises from this text, please change parameters."),
+            )
+            return redirect("exercise_create")
+        await sync_to_async(prefetch.refill_async)(
+            request.user.pk, version, filepath, kwargs
+        )
 
         # populate form fields
         data["count"] = params.count
         data["current_count"] = params.current_count
-        audio = self.upload_audio(filepath, data)
         form = self.populate_exercise_form(data)
 
         return render(
             request,
             "exercises/show.html",
             {
-                "audio": audio,
+                "audio": await sync_to_async(self.get_audio)(data),
                 "form": form,
             },
         )
 
-    def post(self, request):
+    async def post(self, request):
         form = self.populate_exercise_form(request.POST)
 
         if form.is_valid():
             correct_answer = form.cleaned_data["correct_answer"]
             user_answer = form.cleaned_data["user_answer"]
 
-            form.save(user=request.user)
+            await sync_to_async(form.save)(user=request.user)
 
             if user_answer == correct_answer:
                 correct_answer = None
@@ -241,39 +287,64 @@ class ExerciseShowView(LoginRequiredMixin, TemplateView):
         return render(request, "exercises/show.html", {"form": form})
 
 
-class ExerciseStatsView(LoginRequiredMixin, TemplateView):
+class JobStatusView(LoginRequiredMixin, View):
+    """
+    Returns status of a background job of the current user as json.
+    """
+
+    login_url = reverse_lazy("user_login")
+
+    def get(self, request, pk):
+        job = get_object_or_404(Job, pk=pk, user=request.user)
+        return JsonResponse(
+            {
+                "id": job.pk,
+                "kind": job.kind,
+                "status": job.status,
+                "created_at": job.created_at,
+                "started_at": job.started_at,
+                "finished_at": job.finished_at,
+            }
+        )
+
+
+class AudioStatusView(LoginRequiredMixin, View):
+    """
+    Returns whether audio of an exercise is ready as json.
+    """
+
+    login_url = reverse_lazy("user_login")
+
+    def get(self, request, key):
+        return JsonResponse({"ready": audio.is_ready(key), "url": audio.get_url(key)})
+
+
+class ExerciseStatsView(AsyncLoginRequiredMixin, TemplateView):
     """
     Show exercise stats for the current user.
     """
 
     login_url = reverse_lazy("user_login")
 
-    def get(self, request):
-        user_stats = Exercise.objects.filter(user=request.user).order_by("-pk")
+    async def get(self, request):
+        # kept up to date by Exercise.save, see ExerciseStats
+        stats = await ExerciseStats.objects.filter(user=request.user).afirst()
 
-        if user_stats.count() == 0:
+        if stats is None or stats.total == 0:
             messages.warning(
                 request,
                 _("No exercises have been completed yet, stats are not available."),
             )
             return redirect("home")
 
-        subquery = user_stats[:100]
-        query_total = Exercise.objects.filter(pk__in=subquery).count()
-        query_correct = (
-            Exercise.objects.filter(pk__in=subquery).filter(flag=True).count()
-        )
-
-        total_count = user_stats.count()
-        correct_count = user_stats.filter(flag=True).count()
-        percentage_last_100 = f"{query_correct / query_total:.1%}"
+        percentage_last_100 = f"{stats.recent_correct() / len(stats.recent):.1%}"
 
         return render(
             request,
             "exercises/stats.html",
             {
-                "total_count": total_count,
-                "correct_answers": correct_count,
+                "total_count": stats.total,
+                "correct_answers": stats.correct,
                 "percentage": percentage_last_100,
             },
         )
@@ -290,7 +361,8 @@ class ExerciseStatsDeleteView(LoginRequiredMixin, TemplateView):
         return render(request, "exercises/stats_delete.html")
 
     def post(self, request):
-        user_stats = Exercise.objects.filter(user=request.user)
-        user_stats.delete()
+        with transaction.atomic():
+            Exercise.objects.filter(user=request.user).delete()
+            ExerciseStats.objects.filter(user=request.user).delete()
         messages.success(request, _("Stats deleted successfully!"))
         return redirect("home")
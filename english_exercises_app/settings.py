@@ -187,10 +187,58 @@ CSRF_TRUSTED_ORIGINS = [
 ]
 
 FILE_UPLOAD_HANDLERS = [
+    "english_exercises_app.exercises.uploadhandlers.MaxSizeUploadHandler",
+    "english_exercises_app.exercises.uploadhandlers.ContentHashUploadHandler",
     "django.core.files.uploadhandler.MemoryFileUploadHandler",
     "django.core.files.uploadhandler.TemporaryFileUploadHandler",
 ]
 
+# uploaded texts are read in chunks, but larger files take long to parse
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 20 * 2**20))  # bytes
+
+# pre-generated exercises are shared between server processes
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # shared by web and job worker processes: queues of pre-generated
+    # exercises (see exercises.prefetch), status of TTS API (see exercises.audio)
+    "exercises": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": BASE_DIR / "cache" / "exercises",
+        # queues of users who stopped doing exercises expire
+        "TIMEOUT": int(os.getenv("EXERCISES_CACHE_TIMEOUT", 7 * 24 * 3600)),
+        "OPTIONS": {
+            # when full, random entries of all users are deleted, so there
+            # should be room for 2 * EXERCISES_PREFETCH_COUNT + 1 keys per user
+            "MAX_ENTRIES": int(os.getenv("EXERCISES_CACHE_MAX_ENTRIES", 100_000)),
+            "CULL_FREQUENCY": 10,  # deletes a tenth of entries
+        },
+    },
+}
+
+# number of exercises generated in advance for every user
+EXERCISES_PREFETCH_COUNT = int(os.getenv("EXERCISES_PREFETCH_COUNT", 3))
+
+# process uploads and prefetch exercises in `manage.py run_workers` processes
+# instead of web server processes
+USE_JOB_WORKERS = os.getenv("USE_JOB_WORKERS", "False") == "True"
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", os.cpu_count() or 1))
+# seconds after which a running job is considered abandoned by a killed worker
+JOB_TIMEOUT = int(os.getenv("JOB_TIMEOUT", 3600))
+# seconds finished jobs are kept for inspection
+JOB_RETENTION = int(os.getenv("JOB_RETENTION", 7 * 24 * 3600))
+
+# threads of a server process running text processing for async views,
+# see exercises.executor
+GENERATION_THREADS = int(os.getenv("GENERATION_THREADS", os.cpu_count() or 1))
+# threads of a server process prefetching exercises, see exercises.executor
+BACKGROUND_THREADS = int(os.getenv("BACKGROUND_THREADS", 2))
+
+# Unix socket of `manage.py nlp_server`: if set, texts are parsed and exercises
+# are generated by the server, and other processes don't load NLP models
+NLP_SERVER_SOCKET = os.getenv("NLP_SERVER_SOCKET")
+
 BOOTSTRAP5 = {
     "error_css_class": "bootstrap5-error",
     "required_css_class": "bootstrap5-required",
@@ -0,0 +1,49 @@
+"""
+Gunicorn settings, picked up automatically when gunicorn starts
+from the project root. Command line options take precedence.
+"""
+
+import gc
+
+timeout = 300
+
+# import the app (and load models) once in the master process, so workers
+# share model memory with it through fork instead of loading their own copies
+preload_app = True
+
+
+def when_ready(server):
+    """
+    Loads NLP models in the master process before workers are forked,
+    unless text is processed by the NLP server (NLP_SERVER_SOCKET is set).
+    """
+
+    from english_exercises_app.exercises.nlp import warm_up
+
+    timings = warm_up()
+    server.log.info(
+        "Models loaded in master in %.2fs (%s)",
+        sum(timings.values()),
+        ", ".join(f"{name}: {seconds:.2f}s" for name, seconds in timings.items()),
+    )
+
+    # move loaded objects to a permanent generation, so the garbage collector
+    # doesn't touch (and thus copy) their memory pages in forked workers
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    """
+    Makes sure models are loaded before the worker starts accepting requests.
+    Models are inherited from the master, so this is a no-op unless
+    preloading is disabled.
+    """
+
+    from english_exercises_app.exercises.nlp import warm_up
+
+    timings = warm_up()
+    worker.log.info(
+        "Worker %s ready, models loaded in %.2fs",
+        worker.pid,
+        sum(timings.values()),
+    )
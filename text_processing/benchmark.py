@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Measures exercise generation latency for skip lengths 3-5.
+
+Usage: python3 -m text_processing.benchmark path/to/text.txt [repeats]
+"""
+
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+from .prepare_data import load_text, prepare_exercises
+from .registry import warm_up
+
+EXERCISE_TYPES = ["type_in", "multiple_choice", "word_order", "blanks"]
+SKIP_LENGTHS = [3, 4, 5]
+
+
+def benchmark(filepath: str, repeats: int = 20) -> Dict[tuple, List[float]]:
+    """
+    Generates every exercise type `repeats` times for each skip length.
+    Returns generation times in seconds keyed by (exercise type, skip length).
+    """
+
+    warm_up()  # don't count model loading
+    load_text(filepath, "benchmark")  # nor parsing and loading the text
+    timings = {}
+    for e_type in EXERCISE_TYPES:
+        for skip_length in SKIP_LENGTHS:
+            kwargs = {
+                "user": "benchmark",
+                "exercise_type": e_type,
+                "pos": ["ALL"],
+                "length": 1,
+                "skip_length": skip_length,
+            }
+            timings[e_type, skip_length] = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                prepare_exercises(filepath, **kwargs)
+                timings[e_type, skip_length].append(time.perf_counter() - start)
+    return timings
+
+
+if __name__ == "__main__":
+    filepath = sys.argv[1]
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    print(f"{'exercise':<16}{'skip':>5}{'mean, ms':>10}{'p50, ms':>10}{'max, ms':>10}")
+    for (e_type, skip_length), times in benchmark(filepath, repeats).items():
+        times = [t * 1000 for t in times]
+        print(
+            f"{e_type:<16}{skip_length:>5}{statistics.mean(times):>10.1f}"
+            f"{statistics.median(times):>10.1f}{max(times):>10.1f}"
+        )
@@ -0,0 +1,93 @@
+"""
+Size-bounded in-process caches.
+"""
+
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+from typing import Any, Callable, Hashable
+
+logger = logging.getLogger(__name__)
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+class LRUCache:
+    """
+    Dict-like cache evicting least recently used entries
+    once it holds more than maxsize items.
+    With getsize, maxsize bounds the total size of values instead,
+    e.g. in bytes. A value larger than maxsize is not cached at all,
+    a warning is logged, since it's loaded again on every use.
+    Counts hits and misses of get() calls, see info().
+    Thread-safe: caches are shared by all threads of a process.
+    """
+
+    def __init__(self, maxsize: int, getsize: Callable[[Any], int] = None):
+        self.maxsize = maxsize
+        self.getsize = getsize or (lambda value: 1)
+        self.currsize = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        size = self.getsize(value)  # may be slow, computed outside the lock
+        if size > self.maxsize:
+            self.pop(key)
+            logger.warning(
+                "%r of size %s is not cached, cache size is %s",
+                key,
+                size,
+                self.maxsize,
+            )
+            return
+
+        with self._lock:
+            self._pop(key)
+            self._data[key] = value
+            self._sizes[key] = size
+            self.currsize += size
+            while self.currsize > self.maxsize:
+                old_key, _ = self._data.popitem(last=False)
+                self.currsize -= self._sizes.pop(old_key)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _pop(self, key: Hashable, default: Any = None) -> Any:
+        if key not in self._data:
+            return default
+        self.currsize -= self._sizes.pop(key)
+        return self._data.pop(key)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            return self._pop(key, default)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.currsize = 0
+            self.hits = self.misses = 0
+
+    def info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, self.currsize)
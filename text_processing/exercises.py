@@ -1,11 +1,9 @@
-import random
-from typing import List, Tuple
+from __future__ import annotations
 
-import gensim.downloader
-import spacy
-import spacy.cli
-from dotenv import load_dotenv
+import random
+from typing import TYPE_CHECKING, List, Tuple, Union
 
+from .parsed_text import ParsedText, join_docs
 from .spacy_token_processing import (
     add_token,
     inflect_token,
@@ -13,14 +11,10 @@ from .spacy_token_processing import (
     replace_element_in_token_list,
     select_skippable_tokens,
 )
+from .synonyms import synonyms_for_many
 
-model = gensim.downloader.load("glove-wiki-gigaword-100")
-
-load_dotenv()
-# dev = bool(os.getenv("DEBUG"))
-# if not dev:  # speed up dev server deploy time
-spacy.cli.download("en_core_web_sm")
-nlp = spacy.load("en_core_web_sm")
+if TYPE_CHECKING:
+    from spacy.tokens import Doc, Span, Token
 
 
 NUM_SYNONYMS = 5  # [3, 10] - defines quality of synonyms for multichoice
@@ -28,83 +22,104 @@ NUM_OPTIONS = 3  # number of options for multichoice exercises, <= NUM_SYNONYMS
 DIVIDER = ".#.#."  # used for identifying skipped text inside django template
 
 
-def replace_word_with_synonyms(word: str) -> List[str]:
+class GenerationError(Exception):
     """
-    Takes a word and returns list of synonyms generated by gensim.
+    Exercise can't be generated from the picked sentence, another attempt
+    (with another sentence) may succeed.
     """
 
-    word_lower = word.lower()
-    try:
-        synonyms = model.most_similar(word_lower)
-        # sometimes gensim suggests punctuation marks as similar words
-        synonyms = [synonym[0] for synonym in synonyms if synonym[0] not in ',.;:!?"']
-    except KeyError:
-        return
-    if word != word_lower:
-        synonyms = [synonym.capitalize() for synonym in synonyms]
-    return synonyms
+
+class NoSentencesError(GenerationError):
+    """
+    Text has no sentences suitable for the exercise parameters,
+    there's no point in another attempt.
+    """
 
 
-def pick_long_sentence(sentences: List[str], length: int) -> str:
+def replace_words_with_synonyms(words: List[str]) -> List[List[str]]:
     """
-    Picks long enough sentence for further processing.
+    Takes a list of words and returns list of synonyms generated by gensim
+    for each word (None for unknown words). Words are looked up in one batch.
     """
 
-    count = 0
-    while count < 100:
-        count += 1
-        rng_sentence = random.randint(0, len(sentences) - length)
+    words_lower = [word.lower() for word in words]
+    results = []
+    for word, word_lower, synonyms in zip(
+        words, words_lower, synonyms_for_many(words_lower)
+    ):
+        if synonyms is not None and word != word_lower:
+            synonyms = [synonym.capitalize() for synonym in synonyms]
+        elif synonyms is not None:
+            synonyms = list(synonyms)
+        results.append(synonyms)
+    return results
+
 
-        if length == 1:
-            sentence = sentences[rng_sentence]
-        else:
-            sentence = " ".join(sentences[rng_sentence : rng_sentence + length])
-        if len(sentence.split(" ")) > 3:
-            return sentence
+def replace_word_with_synonyms(word: str) -> List[str]:
+    """
+    Takes a word and returns list of synonyms generated by gensim.
+    """
 
-    raise Exception("Provided text seems to have only short sentences.")
+    return replace_words_with_synonyms([word])[0]
 
 
-def type_in_exercise(
-    sentences: List[str],
+def pick_sentence(
+    docs: ParsedText,
+    pos: List[str],
+    length: int,
+    skip_length: int,
+    multiple_skips: bool,
+    rng: random.Random = None,
+) -> Doc:
+    """
+    Picks long enough sentence (or `length` consecutive sentences)
+    with tokens to skip for further processing.
+    """
+
+    start = docs.sampler.sample(length, pos, skip_length, multiple_skips, rng)
+    if start is None:
+        raise NoSentencesError(
+            "Provided text has no words to skip with these parameters."
+        )
+    return join_docs(docs[start : start + length])
+
+
+def skip_tokens(
+    docs: ParsedText,
     pos: List[str],
     length: int,
     skip_length: int = 1,
     multiple_skips: bool = False,
-) -> Tuple[str, ...]:
+    rng: random.Random = None,
+) -> Tuple[str, str, str, Union[Span, List[Token]]]:
     """
     Base function for  all other exercises.
     Selects the skips in sentences in accordance with passed user params.
     Skip length is the count of skipped words for user to fill.
+    Besides text of the exercise, returns skipped tokens: a Span for a single
+    skip, a list of Tokens for multiple skips.
+    Random choices of all exercise functions are made with rng, a new
+    random.Random by default, so that generations don't share random state.
     """
 
-    sentence = pick_long_sentence(sentences, length)
-    doc = nlp(sentence)
+    rng = rng or random.Random()
+    doc = pick_sentence(docs, pos, length, skip_length, multiple_skips, rng)
     all_tokens, selected_tokens = select_skippable_tokens(doc, skip_length, pos)
 
     if not selected_tokens:  # sentence is too short
-        return type_in_exercise(sentences, pos, length, skip_length, multiple_skips)
+        raise GenerationError("Sentence has no words to skip.")
 
     elif not multiple_skips:
-        skipped_token = random.choice(selected_tokens)
+        skipped_token = rng.choice(selected_tokens)
         # skipped_token[0] is the token, skipped_token[1] is its position
         begin = "".join(all_tokens[: skipped_token[1]])
         end = "".join(all_tokens[skipped_token[1] + skip_length :])
-        correct_answer = skipped_token[0]
-
-        if skip_length > 1:
-            correct_answer = "".join(
-                [
-                    token
-                    for token in all_tokens[
-                        skipped_token[1] : skipped_token[1] + skip_length
-                    ]
-                ]
-            ).strip()
+        skipped = doc[skipped_token[1] : skipped_token[1] + skip_length]
+        correct_answer = skipped.text
 
     # blanks exercises only
     elif len(selected_tokens) >= skip_length:
-        selected_tokens = random.sample(selected_tokens, skip_length)
+        selected_tokens = rng.sample(selected_tokens, skip_length)
         selected_tokens.sort(key=lambda x: x[1])
         correct_answer = []
         for idx in range(len(selected_tokens)):
@@ -115,36 +130,56 @@ def type_in_exercise(
         correct_answer = ", ".join(correct_answer)
         begin = "".join(all_tokens)
         end = ""  # preserved for interface compatibility
+        skipped = [doc[token[1]] for token in selected_tokens]
 
     # in case sentence doesn't contain desired pos or number of pos
     else:
-        return type_in_exercise(sentences, pos, length, skip_length, multiple_skips)
+        raise GenerationError("Sentence has not enough words to skip.")
+
+    return (correct_answer, begin, end, skipped)
+
 
+def type_in_exercise(
+    docs: ParsedText,
+    pos: List[str],
+    length: int,
+    skip_length: int = 1,
+    multiple_skips: bool = False,
+    rng: random.Random = None,
+) -> Tuple[str, ...]:
+    correct_answer, begin, end, _ = skip_tokens(
+        docs, pos, length, skip_length, multiple_skips, rng
+    )
     options = None  # preserved for interface compatibility
     return (correct_answer, begin, end, options)
 
 
 def multiple_choice_exercise(
-    sentences: List[str], pos: List[str], length: int, skip_length: int = 1
+    docs: ParsedText,
+    pos: List[str],
+    length: int,
+    skip_length: int = 1,
+    rng: random.Random = None,
 ) -> Tuple[str, str, str, List[str]]:
-    correct_answer, begin, end, options = type_in_exercise(
-        sentences, pos, length, skip_length=1
+    rng = rng or random.Random()
+    correct_answer, begin, end, skipped = skip_tokens(
+        docs, pos, length, skip_length=1, rng=rng
     )
 
     synonyms = replace_word_with_synonyms(correct_answer)
     if not synonyms:
-        return multiple_choice_exercise(sentences, pos, length)
+        raise GenerationError(f"No synonyms found for {correct_answer}.")
 
     # adding some customization
-    token = nlp(correct_answer)[0]
-    inflected_token = inflect_token(token)
+    token = skipped[0]
+    inflected_token = inflect_token(token, rng=rng)
     if inflected_token and inflected_token not in synonyms:
         synonyms.insert(0, inflected_token)
 
     if len(synonyms) > NUM_SYNONYMS:
         subsample = synonyms[:NUM_SYNONYMS]
         # don't repeat options on same word
-        options = random.sample(subsample, NUM_OPTIONS)
+        options = rng.sample(subsample, NUM_OPTIONS)
         # options should contain tuples to correctly work with django forms
         options = list(zip(options, options))
     else:
@@ -153,46 +188,50 @@ def multiple_choice_exercise(
         ]
 
     options.append((correct_answer, correct_answer))
-    random.shuffle(options)
+    rng.shuffle(options)
 
     return (correct_answer, begin, end, options)
 
 
 def word_order_exercise(
-    sentences: List[str], pos: List[str], length: int, skip_length: int
+    docs: ParsedText,
+    pos: List[str],
+    length: int,
+    skip_length: int,
+    rng: random.Random = None,
 ) -> Tuple[str, str, str, List[str]]:
-    correct_answer, begin, end, options = type_in_exercise(
-        sentences, pos, length, skip_length
+    rng = rng or random.Random()
+    correct_answer, begin, end, answer = skip_tokens(
+        docs, pos, length, skip_length, rng=rng
     )
-    answer = nlp(correct_answer)
     split = [token for token in answer]
 
     # get rid of exercises with punctuation marks - they are bad
     # just in case checking length (skip length is >= 3 - form params)
     if any([x.is_punct for x in split]) or len(split) < 3:
-        return word_order_exercise(sentences, pos, length, skip_length)
+        raise GenerationError("Skipped words contain punctuation.")
 
     options = []
 
     # create the same string with one removed article/aux verb
-    removed = remove_token(answer)
+    removed = remove_token(answer, rng)
     if removed:
         options.append(removed)  # current options len = 0-1
 
     # same string with an article before noun
-    added = add_token(answer)
+    added = add_token(answer, rng)
     if added:
         options.append(added)  # current options len = 0-2
 
     # create the same string with one inflected verb/adjective
-    inflected = inflect_token(answer, multiple_tokens=True)
+    inflected = inflect_token(answer, multiple_tokens=True, rng=rng)
     if inflected:
         options.extend(inflected)  # current options len = 0-skip_length+2
 
     # replace a word with synonym
     split = [token for token in answer]
-    i = random.choice(range(len(split)))
-    syn_rank = random.choice(range(NUM_SYNONYMS))
+    i = rng.choice(range(len(split)))
+    syn_rank = rng.choice(range(NUM_SYNONYMS))
 
     word = split[i].text
     synonyms = replace_word_with_synonyms(word)
@@ -205,14 +244,14 @@ def word_order_exercise(
     # adding 2 sentences with incorrect order in any case
     count = 0
     while count < NUM_OPTIONS - 1:
-        random.shuffle(split)
+        rng.shuffle(split)
         joined = " ".join([token.text for token in split]).strip()
         if joined not in options:
             options.append(joined)
             # len = 2-skip_length+5, i.e. [NUM_OPTIONS-1, NUM_OPTIONS+n]
             count += 1
 
-    options = random.sample(options, min(NUM_OPTIONS, len(options)))
+    options = rng.sample(options, min(NUM_OPTIONS, len(options)))
     options.append(correct_answer)
     options = set(options)  # may contain duplicates
     options = list(zip(options, options))  # format to work with django forms
@@ -220,34 +259,37 @@ def word_order_exercise(
 
 
 def blanks_exercise(
-    sentences: List[str], pos: List[str], length: int, skip_length: int
+    docs: ParsedText,
+    pos: List[str],
+    length: int,
+    skip_length: int,
+    rng: random.Random = None,
 ) -> Tuple[str, str, str, List[str]]:
+    rng = rng or random.Random()
     # getting a sequence of sentences with correct length
     # performing all necessary length checks
-    correct_answer, begin, end, options = type_in_exercise(
-        sentences, pos, length, skip_length, multiple_skips=True
+    correct_answer, begin, end, tokens = skip_tokens(
+        docs, pos, length, skip_length, multiple_skips=True, rng=rng
     )
     split_correct_answer = correct_answer.split(", ")
-    doc = nlp(" ".join(split_correct_answer))
-    tokens = [token for token in doc]
     options = []
 
-    for token in tokens:
+    all_synonyms = replace_words_with_synonyms([token.text for token in tokens])
+    for token, synonyms in zip(tokens, all_synonyms):
         if token.pos_ == "DET":
             options.extend(["a", "an", "the"])
-        inflected_token = inflect_token(token)
+        inflected_token = inflect_token(token, rng=rng)
         if inflected_token:
             options.append(inflected_token)
 
-        syn_rank = random.choice(range(NUM_SYNONYMS))
-        synonyms = replace_word_with_synonyms(token.text)
+        syn_rank = rng.choice(range(NUM_SYNONYMS))
         if synonyms:
             option = synonyms[syn_rank]
             options.append(option)
 
-    options = random.sample(options, max(len(options) - 1, 0))
+    options = rng.sample(options, max(len(options) - 1, 0))
     options.extend(split_correct_answer)
-    random.shuffle(options)
+    rng.shuffle(options)
     options = set(options)
     options = ", ".join(options)
 
@@ -0,0 +1,91 @@
+"""
+Memoized inflections of lemmas, used for distractors instead of calling
+lemminflect through the token._.inflect extension for every candidate.
+
+Inflections are keyed by (lemma, POS, tag). Inflections of all VERB and ADJ
+lemmas of a text are computed once when it's parsed and stored in its index
+(see TextIndex), and loaded into the cache with the text, so requests
+normally don't call lemminflect at all.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import TYPE_CHECKING, Dict, Iterable, Tuple, Union
+
+from .cache import LRUCache
+
+if TYPE_CHECKING:
+    from spacy.tokens import Token
+
+INFLECTION_DICT = {  # options for inflecting pos
+    "VERB": ["VBG", "VBN", "VBZ"],
+    "ADJ": ["JJR", "JJS", "RB"],
+}
+INFLECTION_CACHE_SIZE = int(os.getenv("INFLECTION_CACHE_SIZE", 200_000))
+# separates lemma, POS and tag in keys of stored inflections
+SEPARATOR = "|"
+
+cache = LRUCache(INFLECTION_CACHE_SIZE)
+_missing = object()
+
+
+def get_inflection(lemma: str, pos: str, tag: str) -> Union[str, None]:
+    """
+    Returns inflection of a lowercase lemma, None if there's none.
+    """
+
+    key = (lemma, pos, tag)
+    inflection = cache.get(key, _missing)
+    if inflection is _missing:
+        from lemminflect import getInflection
+
+        inflections = getInflection(lemma, tag=tag)
+        inflection = inflections[0] if inflections else None
+        cache[key] = inflection
+    return inflection
+
+
+def apply_case(word: str, sample: str) -> str:
+    # same capitalization rules as lemminflect uses
+    if sample.isupper():
+        return word.upper()
+    if sample and sample[0].isupper():
+        return word.capitalize()
+    return word
+
+
+def inflect(token: Token, tag: str) -> str:
+    """
+    Same as token._.inflect(tag), but memoized: returns token inflected
+    to tag, or token text if it can't be inflected.
+    """
+
+    inflection = get_inflection(token.lemma_.lower(), token.pos_, tag)
+    if inflection is None:
+        return token.text
+    return apply_case(inflection, token.text)
+
+
+def compute(lemmas: Iterable[Tuple[str, str]]) -> Dict[str, Union[str, None]]:
+    """
+    Computes inflections of (lemma, POS) pairs to all tags of INFLECTION_DICT.
+    Returns them in the form stored in text index, see load().
+    Lemmas without inflection are stored too, with None.
+    """
+
+    inflections = {}
+    for lemma, pos in lemmas:
+        for tag in INFLECTION_DICT.get(pos, []):
+            key = SEPARATOR.join((lemma, pos, tag))
+            inflections[key] = get_inflection(lemma, pos, tag)
+    return inflections
+
+
+def load(inflections: Dict[str, Union[str, None]]) -> None:
+    """
+    Adds inflections computed by compute() to the cache.
+    """
+
+    for key, inflection in inflections.items():
+        cache[tuple(key.rsplit(SEPARATOR, 2))] = inflection
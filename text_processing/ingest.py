@@ -0,0 +1,133 @@
+"""
+Processing of uploaded texts: sentence splitting and spaCy parsing.
+Large texts are split in chunks and parsed in several processes.
+Files are read and split as a stream, so memory used for splitting
+doesn't depend on text size.
+"""
+
+from __future__ import annotations
+
+import itertools
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Iterable, Iterator, List, TextIO
+
+from sentence_splitter import SentenceSplitter
+
+from .pipelines import pool
+
+if TYPE_CHECKING:
+    from spacy.tokens import Doc
+
+CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", 200_000))  # characters
+BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 256))  # sentences
+# job workers parse texts at once, each of them gets its share of CPUs
+# (same defaults as JOB_WORKERS and USE_JOB_WORKERS of the app settings)
+_PARSING_PROCESSES = (
+    int(os.getenv("JOB_WORKERS", os.cpu_count() or 1))
+    if os.getenv("USE_JOB_WORKERS", "False") == "True"
+    else 1
+)
+PROCESSES = int(
+    os.getenv(
+        "INGEST_PROCESSES", max((os.cpu_count() or 1) // _PARSING_PROCESSES, 1)
+    )
+)
+# texts with fewer sentences are parsed in the current process, starting
+# worker processes would take longer than parsing
+PARALLEL_THRESHOLD = int(os.getenv("INGEST_PARALLEL_THRESHOLD", 2000))
+
+# pipeline components not used by exercise generators
+DISABLED_COMPONENTS = ["parser", "ner"]
+
+
+def split_chunks(text: str, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """
+    Splits text into chunks of about chunk_size characters at line breaks.
+    Sentence splitter never joins lines, so chunks split into the same
+    sentences as the whole text.
+    """
+
+    start = 0
+    while len(text) - start > chunk_size:
+        end = text.rfind("\n", start, start + chunk_size)
+        if end == -1:  # no line breaks, cut after the last sentence end
+            end = text.rfind(". ", start, start + chunk_size) + 1
+        if end <= start:
+            end = start + chunk_size
+        yield text[start:end]
+        start = end + 1 if text[end : end + 1].isspace() else end
+    yield text[start:]
+
+
+def split_sentences(text: str) -> List[str]:
+    splitter = SentenceSplitter(language="en")
+    return [sentence for sentence in splitter.split(text) if sentence]
+
+
+def read_chunks(file: TextIO, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """
+    Reads text file in the same chunks as split_chunks() splits the whole
+    text into. Only the unfinished end of the last read is carried over,
+    so at most about 2 * chunk_size characters are kept in memory.
+    """
+
+    rest = ""
+    while True:
+        data = file.read(chunk_size)
+        if not data:
+            break
+        *chunks, rest = split_chunks(rest + data, chunk_size)
+        yield from chunks
+    yield rest
+
+
+def split_chunked(chunks: Iterable[str]) -> Iterator[str]:
+    """
+    Splits chunks of text into sentences, yielding them in order.
+    If there's more than one chunk, chunks are split in parallel, with
+    a bounded number of them waiting for a worker process.
+    """
+
+    chunks = iter(chunks)
+    first = list(itertools.islice(chunks, 2))
+    if len(first) == 1 or PROCESSES == 1:
+        for chunk in itertools.chain(first, chunks):
+            yield from split_sentences(chunk)
+        return
+
+    with ProcessPoolExecutor(PROCESSES) as executor:
+        pending = deque()
+        for chunk in itertools.chain(first, chunks):
+            pending.append(executor.submit(split_sentences, chunk))
+            if len(pending) >= 2 * PROCESSES:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def split_file(path: str) -> Iterator[str]:
+    """
+    Splits text file into sentences, reading it in chunks.
+    """
+
+    with open(path, "r") as file:
+        yield from split_chunked(read_chunks(file))
+
+
+def parse_sentences(sentences: Iterable[str], count: int = 0) -> Iterator[Doc]:
+    """
+    Parses sentences with spaCy, yielding Docs in order as they are ready.
+    Pass count of sentences to parse large texts in several processes.
+    """
+
+    n_process = PROCESSES if count >= PARALLEL_THRESHOLD else 1
+    # pipeline is used by this thread only until all sentences are parsed
+    with pool.handle() as nlp:
+        yield from nlp.pipe(
+            sentences,
+            batch_size=BATCH_SIZE,
+            n_process=n_process,
+            disable=DISABLED_COMPONENTS,
+        )
@@ -0,0 +1,321 @@
+"""
+Text processing served to other processes of the host over a Unix socket.
+
+`manage.py nlp_server` loads spaCy pipelines and GloVe vectors once, and
+web and job worker processes send it texts to parse and parameters of
+exercises to generate (see NLPClient), so they don't load models at all
+and can be scaled without multiplying model memory. Several servers may
+run on separate sockets.
+
+Every message is a frame:
+    code (uint8), payload length (uint32), payload, utf-8 json
+
+Requests are sent with an operation code (see OPERATIONS) and keyword
+arguments of the operation as payload. Responses are sent with a status
+code: STATUS_OK with the result as payload, or STATUS_ERROR with the type
+and message of the exception raised by the operation. A connection
+carries any number of requests, one at a time.
+"""
+
+import json
+import logging
+import os
+import socket
+import socketserver
+import struct
+import threading
+from typing import Any, Dict, List, Tuple, Union
+
+from .exercises import GenerationError, NoSentencesError
+from .inflections import get_inflection
+from .ingest import DISABLED_COMPONENTS
+from .pipelines import pool
+from .prepare_data import load_text, prepare_exercises
+from .synonyms import synonyms_for_many
+
+logger = logging.getLogger(__name__)
+
+FRAME = struct.Struct("<BI")
+MAX_PAYLOAD = 64 * 2**20  # bytes
+
+# maximum number of requests processed by a server at once
+NLP_SERVER_THREADS = int(os.getenv("NLP_SERVER_THREADS", os.cpu_count() or 1))
+# seconds a client waits for a response
+NLP_SERVER_TIMEOUT = float(os.getenv("NLP_SERVER_TIMEOUT", 300))
+# permissions of the socket: processes of other users can't send requests,
+# e.g. to parse any file the server can read
+NLP_SERVER_SOCKET_MODE = int(os.getenv("NLP_SERVER_SOCKET_MODE", "660"), 8)
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+OP_PING = 0
+OP_TAG = 1
+OP_SYNONYMS = 2
+OP_INFLECT = 3
+OP_PREPARE_EXERCISES = 4
+OP_LOAD_TEXT = 5
+
+# exceptions raised again by clients, others are raised as NLPServerError
+ERRORS = {
+    error.__name__: error
+    for error in (GenerationError, NoSentencesError, FileNotFoundError)
+}
+
+
+class NLPServerError(Exception):
+    """
+    Server can't be reached, or failed to process a request.
+    """
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 2**20))
+        if not chunk:
+            raise EOFError
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def send_frame(sock: socket.socket, code: int, payload: Any) -> None:
+    data = json.dumps(payload, separators=(",", ":")).encode()
+    if len(data) > MAX_PAYLOAD:
+        raise ValueError(f"Payload of {len(data)} bytes is too large.")
+    sock.sendall(FRAME.pack(code, len(data)) + data)
+
+
+def recv_frame(sock: socket.socket) -> Tuple[int, Any]:
+    """
+    Returns code and payload of the next frame.
+    Raises EOFError if connection was closed.
+    """
+
+    code, size = FRAME.unpack(_recv_exactly(sock, FRAME.size))
+    if size > MAX_PAYLOAD:
+        raise ValueError(f"Payload of {size} bytes is too large.")
+    return code, json.loads(_recv_exactly(sock, size))
+
+
+def ping() -> bool:
+    return True
+
+
+def tag(sentences: List[str]) -> List[List[list]]:
+    """
+    Returns text, trailing whitespace, POS, tag and lemma of every token
+    of every sentence.
+    """
+
+    with pool.handle() as nlp:
+        docs = list(nlp.pipe(sentences, disable=DISABLED_COMPONENTS))
+    return [
+        [[t.text, t.whitespace_, t.pos_, t.tag_, t.lemma_] for t in doc]
+        for doc in docs
+    ]
+
+
+def inflect(lemmas: List[List[str]]) -> List[Union[str, None]]:
+    """
+    Returns inflections of (lemma, POS, tag) triples.
+    """
+
+    return [get_inflection(lemma, pos, tag) for lemma, pos, tag in lemmas]
+
+
+def parse_text(text_path: str, username: str) -> bool:
+    # parsed text isn't sent back, clients only need it stored
+    load_text(text_path, username)
+    return True
+
+
+OPERATIONS = {
+    OP_PING: ping,
+    OP_TAG: tag,
+    OP_SYNONYMS: synonyms_for_many,
+    OP_INFLECT: inflect,
+    OP_PREPARE_EXERCISES: prepare_exercises,
+    OP_LOAD_TEXT: parse_text,
+}
+
+
+class RequestHandler(socketserver.BaseRequestHandler):
+    """
+    Processes requests of a connection until the client closes it.
+    """
+
+    def setup(self):
+        with self.server.connections_lock:
+            self.server.connections.add(self.request)
+
+    def finish(self):
+        with self.server.connections_lock:
+            self.server.connections.discard(self.request)
+
+    def handle(self):
+        while True:
+            try:
+                code, kwargs = recv_frame(self.request)
+            except (EOFError, ConnectionError):
+                return
+            except ValueError:
+                logger.exception("Malformed request, closing connection")
+                return
+
+            operation = OPERATIONS.get(code)
+            if operation is None:
+                payload = {"type": "ValueError", "message": f"Unknown operation {code}"}
+                send_frame(self.request, STATUS_ERROR, payload)
+                continue
+
+            try:
+                with self.server.slots:
+                    result = operation(**kwargs)
+                status, payload = STATUS_OK, result
+            except Exception as e:
+                if type(e).__name__ not in ERRORS:
+                    logger.exception("Operation %s failed", code)
+                status = STATUS_ERROR
+                payload = {"type": type(e).__name__, "message": str(e)}
+
+            try:
+                send_frame(self.request, status, payload)
+            except (TypeError, ValueError) as e:  # result can't be sent
+                logger.exception("Operation %s returned invalid result", code)
+                payload = {"type": type(e).__name__, "message": str(e)}
+                send_frame(self.request, STATUS_ERROR, payload)
+            except ConnectionError:
+                return
+
+
+class NLPServer(socketserver.ThreadingUnixStreamServer):
+    """
+    Serves OPERATIONS on a Unix socket, a thread per connection.
+    At most `threads` requests are processed at once, others wait.
+    """
+
+    daemon_threads = True
+    # every thread of every client process keeps a connection
+    request_queue_size = 128
+
+    def __init__(
+        self,
+        path: str,
+        threads: int = NLP_SERVER_THREADS,
+        mode: int = NLP_SERVER_SOCKET_MODE,
+    ):
+        # socket of a stopped server is left behind
+        if os.path.exists(path):
+            os.remove(path)
+        self.mode = mode
+        self.slots = threading.BoundedSemaphore(max(threads, 1))
+        self.connections = set()
+        self.connections_lock = threading.Lock()
+        super().__init__(path, RequestHandler)
+
+    def server_bind(self):
+        # socket is created accessible to the owner only, then opened up
+        # to mode, so it's never accessible to others in between
+        umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+        os.chmod(self.server_address, self.mode)
+
+    def server_close(self):
+        super().server_close()
+        # clients see connections closed and reconnect to a new server
+        with self.connections_lock:
+            for connection in self.connections:
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+class NLPClient:
+    """
+    Client of an NLPServer, safe to share between threads:
+    every thread keeps its own connection.
+    """
+
+    def __init__(self, path: str, timeout: float = NLP_SERVER_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            # blocking connect waits while the server's backlog is full
+            sock.connect(self.path)
+        except OSError as e:
+            sock.close()
+            raise NLPServerError(f"Can't connect to {self.path}: {e}") from e
+        sock.settimeout(self.timeout)
+        return sock
+
+    def close(self) -> None:
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    def call(self, code: int, **kwargs) -> Any:
+        """
+        Sends a request and returns its result. Exceptions of ERRORS
+        are raised as they were raised by the operation.
+        """
+
+        sock = getattr(self._local, "sock", None)
+        # connection kept from a previous call may have been closed
+        # by a restarted server, then the request is sent once more
+        for reused in ((True, False) if sock is not None else (False,)):
+            if not reused:
+                sock = self._local.sock = self._connect()
+            try:
+                send_frame(sock, code, kwargs)
+                status, payload = recv_frame(sock)
+                break
+            except socket.timeout as e:
+                self.close()
+                raise NLPServerError(f"No response from {self.path}") from e
+            except (EOFError, OSError) as e:
+                # a response may still arrive, so connection can't be reused
+                self.close()
+                if not reused:
+                    raise NLPServerError(f"Request to {self.path} failed: {e}") from e
+
+        if status == STATUS_OK:
+            return payload
+        error = ERRORS.get(payload["type"])
+        if error is None:
+            raise NLPServerError(f"{payload['type']}: {payload['message']}")
+        raise error(payload["message"])
+
+    def ping(self) -> bool:
+        return self.call(OP_PING)
+
+    def tag(self, sentences: List[str]) -> List[List[list]]:
+        return self.call(OP_TAG, sentences=sentences)
+
+    def synonyms(self, words: List[str]) -> List[Union[List[str], None]]:
+        return self.call(OP_SYNONYMS, words=words)
+
+    def inflect(self, lemmas: List[Tuple[str, str, str]]) -> List[Union[str, None]]:
+        return self.call(OP_INFLECT, lemmas=[list(lemma) for lemma in lemmas])
+
+    def load_text(self, text_path: str, username: str) -> None:
+        self.call(OP_LOAD_TEXT, text_path=text_path, username=username)
+
+    def prepare_exercises(self, filepath: str, **kwargs) -> Dict[str, Any]:
+        exercise = self.call(OP_PREPARE_EXERCISES, filepath=filepath, **kwargs)
+        if exercise["options"] and isinstance(exercise["options"][0], list):
+            # json has no tuples, choices of django forms are tuples
+            exercise["options"] = [tuple(option) for option in exercise["options"]]
+        return exercise
@@ -0,0 +1,229 @@
+"""
+Texts parsed by spaCy at upload time, so that exercise generation doesn't
+need to run the pipeline on every request.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from array import array
+from collections.abc import Sequence
+from functools import cached_property
+from typing import TYPE_CHECKING, Dict, Iterable, List, Union
+
+import numpy as np
+
+from .inflections import INFLECTION_DICT
+from .inflections import compute as compute_inflections
+from .inflections import load as load_inflections
+from .ingest import parse_sentences
+from .pipelines import vocab_lock
+from .registry import get_vocab
+from .store import ArrayStore, DocStore
+from .windows import WINDOWS_CACHE_SIZE, WindowSampler, prefix_sum
+
+if TYPE_CHECKING:
+    from spacy.tokens import Doc
+
+# inflections of VERB and ADJ lemmas are computed when a text is parsed
+PRECOMPUTE_INFLECTIONS = os.getenv("PRECOMPUTE_INFLECTIONS", "True") == "True"
+
+# token offsets are stored as uint32, texts are much shorter than 2**32 tokens
+NO_POSITIONS = np.zeros(0, dtype="<u4")
+
+
+class TextIndex:
+    """
+    Offsets of tokens of each part of speech in the whole text, along with
+    prefix sums of per-sentence token, word and non-punctuation token counts,
+    as numpy arrays. Offset of a token is its position in the text: offset
+    of its sentence (see token_offsets) plus its position in the sentence.
+    Allows finding sentences with skippable tokens without restoring Docs,
+    see WindowSampler.
+    Also stores inflections of the text's lemmas, see inflections module.
+
+    Index is stored in an ArrayStore: arrays of an index loaded from disk
+    are memory mapped and read only when they are used.
+    """
+
+    def __init__(
+        self,
+        arrays: Union[Dict[str, np.ndarray], ArrayStore],
+        inflections: Dict[str, Union[str, None]] = None,
+    ):
+        self.arrays = arrays
+        self.inflections = inflections or {}
+
+    @property
+    def token_offsets(self) -> np.ndarray:
+        return self.arrays.get("token_offsets")
+
+    @property
+    def word_sums(self) -> np.ndarray:
+        return self.arrays.get("word_sums")
+
+    @property
+    def non_punct_sums(self) -> np.ndarray:
+        return self.arrays.get("non_punct_sums")
+
+    def positions(self, pos: str) -> np.ndarray:
+        """
+        Sorted offsets of tokens with the part of speech.
+        """
+
+        positions = self.arrays.get(f"pos:{pos}")
+        return NO_POSITIONS if positions is None else positions
+
+    @classmethod
+    def from_docs(cls, docs: Iterable[Doc]) -> TextIndex:
+        positions = {}
+        lemmas = set()
+        n_words, n_tokens, n_non_punct = array("q"), array("q"), array("q")
+        offset = 0
+        for doc in docs:
+            for token in doc:
+                positions.setdefault(token.pos_, array("I")).append(offset + token.i)
+                if token.pos_ in INFLECTION_DICT:
+                    lemmas.add((token.lemma_.lower(), token.pos_))
+            n_words.append(len(doc.text.split(" ")))
+            n_tokens.append(len(doc))
+            n_non_punct.append(sum(not token.is_punct for token in doc))
+            offset += len(doc)
+
+        arrays = {
+            "token_offsets": prefix_sum(n_tokens),
+            "word_sums": prefix_sum(n_words),
+            "non_punct_sums": prefix_sum(n_non_punct),
+        }
+        for pos, offsets in positions.items():
+            arrays[f"pos:{pos}"] = np.asarray(offsets, dtype=NO_POSITIONS.dtype)
+
+        inflections = compute_inflections(lemmas) if PRECOMPUTE_INFLECTIONS else {}
+        return cls(arrays, inflections)
+
+    @classmethod
+    def from_json(cls, path: str) -> TextIndex:
+        """
+        Reads index of older versions: positions as (sentence, token) pairs
+        and per-sentence counts in a json file.
+        """
+
+        with open(path, "r") as f:
+            data = json.load(f)
+        token_offsets = prefix_sum(data["n_tokens"])
+        arrays = {
+            "token_offsets": token_offsets,
+            "word_sums": prefix_sum(data["n_words"]),
+            "non_punct_sums": prefix_sum(data["n_non_punct"]),
+        }
+        for pos, pairs in data["pos"].items():
+            pairs = np.array(pairs, dtype=np.int64).reshape((-1, 2))
+            offsets = token_offsets[pairs[:, 0]] + pairs[:, 1]
+            arrays[f"pos:{pos}"] = offsets.astype(NO_POSITIONS.dtype)
+        return cls(arrays, data.get("inflections"))
+
+    @classmethod
+    def from_disk(cls, path: str) -> TextIndex:
+        store = ArrayStore(path)
+        return cls(store, store.meta["inflections"])
+
+    def to_disk(self, path: str) -> None:
+        arrays = {name: self.arrays.get(name) for name in self.arrays.keys()}
+        ArrayStore.write(path, arrays, {"inflections": self.inflections})
+
+
+class ParsedText(Sequence):
+    """
+    Sentences of a text as spaCy Doc objects, one Doc per sentence.
+    Docs are stored in a DocStore and restored one at a time on access,
+    so picking a sentence doesn't read the whole text.
+    Safe to use from several threads, see pipelines module.
+    """
+
+    def __init__(self, docs: DocStore, index: TextIndex):
+        from spacy.attrs import ORTH
+
+        self.docs = docs
+        self.index = index
+        self.vocab = get_vocab()
+        with vocab_lock:
+            for string in docs.strings:
+                self.vocab[string]
+        self._orth_column = docs.attrs.index(ORTH)
+        load_inflections(index.inflections)
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    @cached_property
+    def nbytes(self) -> int:
+        """
+        Approximate memory used by the text, for size-bounded caches.
+        Docs and index are memory mapped and not counted, so it doesn't
+        grow with the length of the text, only with its vocabulary.
+        """
+
+        # windows are counted at most, their cache is filled as they're used
+        return (
+            sum(len(string) + 56 for string in self.docs.strings)
+            + WINDOWS_CACHE_SIZE
+        )
+
+    @cached_property
+    def sampler(self) -> WindowSampler:
+        return WindowSampler(self.index)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+
+        from spacy.tokens import Doc
+
+        # same as DocBin.get_docs(), but for a single Doc
+        tokens, spaces = self.docs[i]
+        # restoring adds morphological analyses to the vocab
+        with vocab_lock:
+            doc = Doc(
+                self.vocab,
+                words=tokens[:, self._orth_column],
+                spaces=spaces.tolist(),
+            )
+            return doc.from_array(self.docs.attrs, tokens)
+
+    @classmethod
+    def build(
+        cls, sentences: Sequence[str], path: str, index_path: str
+    ) -> ParsedText:
+        """
+        Parses sentences, writing Docs to path and index to index_path.
+        """
+
+        with DocStore.writer(path) as add:
+
+            def parse():
+                # Docs are written to disk as soon as they are parsed
+                for doc in parse_sentences(sentences, count=len(sentences)):
+                    add(doc)
+                    yield doc
+
+            TextIndex.from_docs(parse()).to_disk(index_path)
+        return cls.from_disk(path, index_path)
+
+    @classmethod
+    def from_disk(cls, path: str, index_path: str) -> ParsedText:
+        return cls(DocStore(path), TextIndex.from_disk(index_path))
+
+
+def join_docs(docs: List[Doc]) -> Doc:
+    """
+    Joins consecutive sentences into one Doc.
+    """
+
+    if len(docs) == 1:
+        return docs[0]
+
+    from spacy.tokens import Doc
+
+    with vocab_lock:
+        return Doc.from_docs(docs, ensure_whitespace=True)
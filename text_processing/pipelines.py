@@ -0,0 +1,82 @@
+"""
+Thread-safe access to spaCy pipelines for threads of a process (threaded
+gunicorn workers, executor of async views, background prefetching).
+
+Text processing is safe to run in several threads at once:
+- spaCy pipelines are not, so texts are parsed with handles taken from
+  a pool (see PipelinePool), each used by one thread at a time;
+- exercise generation doesn't run pipelines, it restores parsed Docs
+  with a separate vocab from the registry, which is written to only
+  under vocab_lock: when a text is loaded and a Doc is restored
+  (see ParsedText);
+- every generation makes its random choices with its own random.Random,
+  see prepare_exercises;
+- in-process caches are locked, see LRUCache.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Iterator
+
+from .registry import LOADERS, get_nlp
+
+if TYPE_CHECKING:
+    from spacy.language import Language
+
+# maximum number of pipelines parsing at once in a process
+NLP_POOL_SIZE = int(os.getenv("NLP_POOL_SIZE", 1))
+
+# guards writes to the vocab of the registry
+vocab_lock = threading.Lock()
+
+
+def _load_handle(i: int) -> "Language":
+    # the first handle is the pipeline loaded by the registry (and shared
+    # with forked workers), others are loaded only if threads parse at once
+    return get_nlp() if i == 0 else LOADERS["nlp"]()
+
+
+class PipelinePool:
+    """
+    Up to size pipeline handles, loaded on demand. A thread asking for
+    a handle while all of them are in use waits for one to be returned.
+    """
+
+    def __init__(self, size: int, load: Callable[[int], "Language"] = _load_handle):
+        self.size = max(size, 1)
+        self._load = load
+        self._idle = []
+        self._loaded = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def handle(self) -> Iterator["Language"]:
+        with self._condition:
+            while not self._idle and self._loaded >= self.size:
+                self._condition.wait()
+            if self._idle:
+                nlp = self._idle.pop()
+            else:
+                nlp = None
+                i = self._loaded
+                self._loaded += 1
+
+        if nlp is None:
+            try:
+                nlp = self._load(i)
+            except BaseException:
+                with self._condition:
+                    self._loaded -= 1
+                    self._condition.notify()
+                raise
+
+        try:
+            yield nlp
+        finally:
+            with self._condition:
+                self._idle.append(nlp)
+                self._condition.notify()
+
+
+pool = PipelinePool(NLP_POOL_SIZE)
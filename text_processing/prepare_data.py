@@ -1,28 +1,44 @@
 #!/usr/bin/env python3
 
 import json
+import logging
 import os
 import random
+import time
 from pathlib import Path
-from typing import List
+from typing import List, Tuple
 
-import requests
 from dotenv import load_dotenv
-from sentence_splitter import SentenceSplitter
 
+from .cache import LRUCache
 from .exercises import (
+    GenerationError,
+    NoSentencesError,
     blanks_exercise,
     multiple_choice_exercise,
     type_in_exercise,
     word_order_exercise,
 )
+from .ingest import split_file
+from .parsed_text import ParsedText, TextIndex
+from .pipelines import pool
+from .store import DocStore, SentenceStore, temporary_path
+from .tts import TTSError, get_client, is_configured
 
 BASE_DIR = Path(__file__).resolve().parent
 load_dotenv()
 load_dotenv(os.path.join(BASE_DIR, ".env"))
 
-API_TOKEN = os.getenv("HUGGINGFACE_API_TOKEN")
-API_URL = "https://api-inference.huggingface.co/models/facebook/fastspeech2-en-ljspeech"
+# limits for generating a single exercise, see generate_exercise
+MAX_ATTEMPTS = int(os.getenv("EXERCISE_MAX_ATTEMPTS", 20))
+TIME_BUDGET = float(os.getenv("EXERCISE_TIME_BUDGET", 2))  # seconds
+# memory for parsed texts kept by each process, see load_text
+TEXT_CACHE_SIZE = int(os.getenv("TEXT_CACHE_SIZE", 256 * 2**20))  # bytes
+
+logger = logging.getLogger(__name__)
+
+# DocStore path -> (stamp of DocStore and index files, ParsedText)
+texts = LRUCache(TEXT_CACHE_SIZE, getsize=lambda entry: entry[1].nbytes)
 
 # key names should be compatible with MemoryForm from exercises module
 EXERCISES = {
@@ -31,6 +47,12 @@ EXERCISES = {
     "word_order": word_order_exercise,
     "blanks": blanks_exercise,
 }
+# simpler exercise to generate if the requested one fails within the limits
+FALLBACKS = {
+    "multiple_choice": "type_in",
+    "word_order": "type_in",
+    "blanks": "type_in",
+}
 
 
 def get_filepath(filepath: str, username: str, extension: str = ".json"):
@@ -39,80 +61,244 @@ def get_filepath(filepath: str, username: str, extension: str = ".json"):
     return path
 
 
-def load_data(text_path: str, username: str) -> List[str]:
+def load_data(text_path: str, username: str) -> SentenceStore:
     """
-    Parsed data is stored in a json file under "json_path" filepath.
-    It is assigned a {username}.json name for uniqueness.
-    Every user has up to 3 associated files: original text, jsonified text, audio.
+    Sentences are stored in a SentenceStore under {username}.sentences
+    filepath for uniqueness.
+    Every user has up to 4 associated files: original text, sentences,
+    parsed text and its index (see load_text). Audio is shared between users,
+    see load_audio.
 
-    Function loads associated user json or creates new json from an uploaded txt.
+    Function loads associated user sentences or splits an uploaded txt into
+    sentences. Sentences in json files of older versions are converted.
     Case when no file is uploaded is handled by django backend.
     """
 
+    sentences_path = get_filepath(text_path, username, extension=".sentences")
+
+    if not os.path.exists(sentences_path):
+        if not convert_data(text_path, username):
+            # sentences are written as the initial text file is read
+            SentenceStore.write(sentences_path, split_file(text_path))
+
+    return SentenceStore(sentences_path)
+
+
+def convert_data(text_path: str, username: str) -> bool:
+    """
+    Converts sentences and parsed text from json and DocBin files
+    of older versions to stores. Returns False if there was nothing to convert.
+    """
+
     json_path = get_filepath(text_path, username)
+    docbin_path = get_filepath(text_path, username, extension=".spacy")
+    if not os.path.exists(json_path):
+        return False
+
+    with open(json_path, "r") as file:
+        sentences = json.load(file)
+    SentenceStore.write(
+        get_filepath(text_path, username, extension=".sentences"), sentences
+    )
+    os.remove(json_path)
+
+    # DocBin is converted as is, its index is still valid
+    if os.path.exists(docbin_path):
+        from spacy.tokens import DocBin
+
+        with open(docbin_path, "rb") as file:
+            doc_bin = DocBin().from_bytes(file.read())
+        docs_path = get_filepath(text_path, username, extension=".docs")
+        with pool.handle() as nlp, DocStore.writer(docs_path) as add:
+            for doc in doc_bin.get_docs(nlp.vocab):
+                add(doc)
+        os.remove(docbin_path)
+
+    return True
+
+
+def convert_index(text_path: str, username: str) -> bool:
+    """
+    Converts json index of older versions to an ArrayStore, see TextIndex.
+    Returns False if there was nothing to convert.
+    """
+
+    json_path = get_filepath(text_path, username, extension=".index.json")
+    docs_path = get_filepath(text_path, username, extension=".docs")
+    if not (os.path.exists(json_path) and os.path.exists(docs_path)):
+        return False
+
+    index_path = get_filepath(text_path, username, extension=".index")
+    TextIndex.from_json(json_path).to_disk(index_path)
+    os.remove(json_path)
+    return True
+
+
+def _get_stamp(*paths: str) -> tuple:
+    stats = [os.stat(path) for path in paths]
+    return tuple((stat.st_mtime_ns, stat.st_size) for stat in stats)
+
+
+def load_text(text_path: str, username: str) -> ParsedText:
+    """
+    Sentences parsed by spaCy are stored in a DocStore under {username}.docs
+    filepath, next to the sentences. Index of token positions by part
+    of speech is stored under {username}.index.
+
+    Function loads parsed sentences, parsing them first if there's no
+    DocStore yet. Call it on upload, so that requests don't have to parse text.
+    Loaded texts are cached in memory until files are changed or removed.
+    """
+
+    docs_path = get_filepath(text_path, username, extension=".docs")
+    index_path = get_filepath(text_path, username, extension=".index")
+
+    if not os.path.exists(docs_path):
+        convert_data(text_path, username)  # text parsed by an older version
 
     try:
-        with open(json_path, "r") as file:
-            sentences = json.load(file)
+        stamp = _get_stamp(docs_path, index_path)
     except FileNotFoundError:
-        with open(text_path, "r") as file:  # read initial text file
-            text = file.read()
+        if not convert_index(text_path, username):
+            text = ParsedText.build(
+                load_data(text_path, username), docs_path, index_path
+            )
+            texts[docs_path] = (_get_stamp(docs_path, index_path), text)
+            return text
+        stamp = _get_stamp(docs_path, index_path)
+
+    cached = texts.get(docs_path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    text = ParsedText.from_disk(docs_path, index_path)
+    texts[docs_path] = (stamp, text)
+    return text
+
 
-        splitter = SentenceSplitter(language="en")
-        sentences = splitter.split(text)
-        with open(json_path, "w") as f:
-            f.write(json.dumps(sentences))
+def has_text(text_path: str, username: str) -> bool:
+    """
+    Whether text was parsed, so load_text won't have to parse it.
+    """
+
+    def exists(extension: str) -> bool:
+        return os.path.exists(get_filepath(text_path, username, extension=extension))
+
+    # index of an older version is converted on load
+    return exists(".docs") and (exists(".index") or exists(".index.json"))
+
+
+def forget_text(text_path: str, username: str) -> None:
+    """
+    Drops text from the cache of parsed texts of this process.
+    """
 
-    return sentences
+    texts.pop(get_filepath(text_path, username, extension=".docs"))
 
 
 def remove_data(text_path: str, username: str):
     """
-    Removes json file associated with text file.
-    Text file deletion is handled by Django.
+    Removes sentences, parsed text and index files associated with text file,
+    including files of older versions. Text file deletion is handled by Django.
     """
 
-    json_path = get_filepath(text_path, username)
-    if os.path.exists(json_path):
-        os.remove(json_path)
+    forget_text(text_path, username)
+    extensions = [".sentences", ".docs", ".index", ".index.json", ".json", ".spacy"]
+    for extension in extensions:
+        path = get_filepath(text_path, username, extension=extension)
+        if os.path.exists(path):
+            os.remove(path)
 
 
-def load_audio(text_path: str, username: str, text_for_audio: str) -> bool:
-    audio_path = get_filepath(text_path, username, extension=".wav")
-    if os.path.exists(audio_path):
-        os.remove(audio_path)
-    if not API_TOKEN:
+def load_audio(audio_path: str, text_for_audio: str) -> bool:
+    """
+    Synthesizes text to a .wav file under audio_path.
+    Returns False if TTS API is not configured or failed, see tts module.
+    """
+
+    if not is_configured():
+        return False
+
+    try:
+        content = get_client().synthesize(text_for_audio)
+    except TTSError:
+        logger.warning("Failed to synthesize audio", exc_info=True)
         return False
 
-    headers = {"Authorization": f"Bearer {API_TOKEN}"}
-    response = requests.post(API_URL, headers=headers, json={"inputs": text_for_audio})
-    with open(audio_path, mode="bx") as f:
-        f.write(response.content)
+    # audio is shared, so it's written under a temporary name first
+    tmp_path = temporary_path(audio_path)
+    with open(tmp_path, mode="wb") as f:
+        f.write(content)
+    os.replace(tmp_path, audio_path)
 
     return True
 
 
-def prepare_exercises(filepath: str, **kwargs) -> dict:
+def generate_exercise(
+    docs: ParsedText,
+    e_type: str,
+    pos: List[str],
+    length: int,
+    skip_length: int,
+    rng: random.Random = None,
+) -> Tuple[str, int, tuple]:
+    """
+    Calls exercise generator until it succeeds, at most MAX_ATTEMPTS times
+    and for at most TIME_BUDGET seconds. If that's not enough, falls back to
+    a simpler exercise type, which gets at least one attempt.
+    Returns generated exercise type, total number of attempts and exercise.
+    """
+
+    attempts = 0
+    deadline = time.monotonic() + TIME_BUDGET
+    while True:
+        attempts += 1
+        try:
+            exercise = EXERCISES[e_type](docs, pos, length, skip_length, rng=rng)
+            return e_type, attempts, exercise
+        except NoSentencesError:
+            if e_type not in FALLBACKS:
+                raise
+        except GenerationError:
+            if attempts < MAX_ATTEMPTS and time.monotonic() < deadline:
+                continue
+            if e_type not in FALLBACKS:
+                raise
+
+        logger.info(
+            "Failed to generate %s exercise in %d attempts, falling back to %s",
+            e_type,
+            attempts,
+            FALLBACKS[e_type],
+        )
+        e_type = FALLBACKS[e_type]
+
+
+def prepare_exercises(filepath: str, seed: int = None, **kwargs) -> dict:
     """
     Dispatcher function to call corresponding exercise generator.
+    Thread-safe, see pipelines module: random choices are made with
+    a random.Random of this call, seeded with seed if it's given.
     """
 
-    sentences = load_data(filepath, str(kwargs.get("user")))
+    rng = random.Random(seed)
+    docs = load_text(filepath, str(kwargs.get("user")))
     e_type = kwargs.get("exercise_type")
     pos = kwargs.get("pos")
     length = kwargs.get("length")
     skip_length = kwargs.get("skip_length", 1)
-    if len(sentences) < length:
-        raise Exception("Provided text is too short.")
+    if len(docs) < length:
+        raise NoSentencesError("Provided text is too short.")
 
     if e_type == "all_choices":
-        e_type = random.choice(list(EXERCISES.keys()))
-        kwargs["exercise_type"] = e_type
+        e_type = rng.choice(list(EXERCISES.keys()))
 
-    correct_answer, begin, end, options = EXERCISES[e_type](
-        sentences, pos, length, skip_length
+    e_type, attempts, exercise = generate_exercise(
+        docs, e_type, pos, length, skip_length, rng
     )
+    correct_answer, begin, end, options = exercise
 
+    kwargs["exercise_type"] = e_type
+    kwargs["attempts"] = attempts
     kwargs["correct_answer"] = correct_answer
     kwargs["begin"] = begin
     kwargs["end"] = end
@@ -0,0 +1,166 @@
+"""
+Lazy registry of the heavy models used for exercise generation.
+
+Nothing is loaded at import time: spaCy pipeline and gensim vectors are
+loaded on first use, so importing text_processing (from Django views, forms
+or management commands) stays cheap. Call warm_up() to load everything
+eagerly, e.g. from a gunicorn hook or `manage.py warm_models`.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict
+
+from .store import temporary_path
+
+SPACY_MODEL = "en_core_web_sm"
+VECTORS_MODEL = "glove-wiki-gigaword-100"
+# native gensim copy of the vectors, memory mapped read-only on load
+VECTORS_PATH = os.getenv("VECTORS_PATH")
+# precomputed synonyms, see `manage.py build_synonyms`
+SYNONYMS_PATH = os.getenv("SYNONYMS_PATH")
+
+logger = logging.getLogger(__name__)
+
+_models = {}
+_lock = threading.Lock()
+
+
+def _load_nlp():
+    import spacy
+
+    try:
+        return spacy.load(SPACY_MODEL)
+    except OSError:  # model package is not installed yet
+        import spacy.cli
+
+        spacy.cli.download(SPACY_MODEL)
+        return spacy.load(SPACY_MODEL)
+
+
+def _load_vocab():
+    import spacy
+
+    # vocab for restoring parsed Docs, separate from the pipeline's vocab,
+    # which is written to while parsing. Lexical attributes (is_punct etc.)
+    # are defined by the language, so they are the same as the pipeline's
+    return spacy.blank(SPACY_MODEL.split("_")[0]).vocab
+
+
+def get_vectors_path() -> str:
+    if VECTORS_PATH:
+        return VECTORS_PATH
+
+    import gensim.downloader
+
+    return os.path.join(gensim.downloader.BASE_DIR, VECTORS_MODEL, "vectors.kv")
+
+
+def convert_vectors(path: str) -> None:
+    """
+    Converts downloaded vectors to native gensim format, which can be memory
+    mapped. Large arrays are stored next to the main file as .npy files.
+    """
+
+    import gensim.downloader
+
+    vectors = gensim.downloader.load(VECTORS_MODEL)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # save under a temporary name first, so other processes never see
+    # a partially written file
+    tmp_path = temporary_path(path)
+    vectors.save(tmp_path)
+    os.replace(f"{tmp_path}.vectors.npy", f"{path}.vectors.npy")
+    os.replace(tmp_path, path)
+
+
+def _load_vectors():
+    from gensim.models import KeyedVectors
+
+    path = get_vectors_path()
+    if not os.path.exists(path):
+        convert_vectors(path)
+
+    # mmap="r" keeps the matrix in the page cache, so it's shared between
+    # all processes using the same file instead of copied into each of them
+    vectors = KeyedVectors.load(path, mmap="r")
+    vectors.fill_norms()  # computed once, not on the first most_similar call
+    return vectors
+
+
+def get_synonyms_path() -> str:
+    if SYNONYMS_PATH:
+        return SYNONYMS_PATH
+    return os.path.join(os.path.dirname(get_vectors_path()), "synonyms")
+
+
+def _load_synonym_table():
+    from .synonyms import SynonymTable
+
+    path = get_synonyms_path()
+    neighbours_path, vocab_path = SynonymTable.paths(path)
+    if not (os.path.exists(neighbours_path) and os.path.exists(vocab_path)):
+        logger.info("No synonym table found at %s, using vectors only", path)
+        return None
+    return SynonymTable.load(path)
+
+
+LOADERS: Dict[str, Callable] = {
+    "nlp": _load_nlp,
+    "vocab": _load_vocab,
+    "vectors": _load_vectors,
+    "synonym_table": _load_synonym_table,
+}
+
+
+def get_model(name: str):
+    """
+    Returns model by name, loading it on first call.
+    Loading is guarded by a lock, so concurrent first calls load it once.
+    Optional models (synonym_table) are None if they were not built.
+    """
+
+    try:
+        return _models[name]
+    except KeyError:
+        pass
+
+    with _lock:
+        if name not in _models:
+            start = time.perf_counter()
+            _models[name] = LOADERS[name]()
+            logger.info("Loaded %s in %.2fs", name, time.perf_counter() - start)
+    return _models[name]
+
+
+def get_nlp():
+    return get_model("nlp")
+
+
+def get_vocab():
+    return get_model("vocab")
+
+
+def get_vectors():
+    return get_model("vectors")
+
+
+def is_loaded(name: str) -> bool:
+    return name in _models
+
+
+def warm_up() -> Dict[str, float]:
+    """
+    Loads all registered models.
+    Returns seconds spent on each model (0 for models that were already loaded).
+    """
+
+    timings = {}
+    for name in LOADERS:
+        start = time.perf_counter()
+        get_model(name)
+        timings[name] = time.perf_counter() - start
+    return timings
@@ -1,21 +1,20 @@
 """
 This module works predominantly with spaCy objects. In order to reuse functions
 from this module, spaCy should be imported explicitly.
+Tokens are inflected with memoized lemminflect lookups, see inflections module.
+Random choices are made with rng, a new random.Random by default.
 """
 
 from __future__ import annotations  # for using better hints with python 3.7+
 
 import random
-from typing import List, Tuple, Union
+from typing import TYPE_CHECKING, List, Tuple, Union
 
-import lemminflect
-from spacy.tokens.doc import Doc
-from spacy.tokens.token import Token
+from .inflections import INFLECTION_DICT, inflect
 
-INFLECTION_DICT = {  # options for inflecting pos
-    "VERB": ["VBG", "VBN", "VBZ"],
-    "ADJ": ["JJR", "JJS", "RB"],
-}
+if TYPE_CHECKING:
+    from spacy.tokens.doc import Doc
+    from spacy.tokens.token import Token
 
 
 def select_skippable_tokens(
@@ -50,13 +49,14 @@ def select_skippable_tokens(
 
 
 def inflect_token(
-    doc: Union[Token, Doc], multiple_tokens: bool = False
+    doc: Union[Token, Doc], multiple_tokens: bool = False, rng: random.Random = None
 ) -> Union[str, List[str]]:
     """
     Function inflecting spacy Token or Doc in accordance with INFLECTION_DICT.
     Returns string if a Token object is passed, returns list, if Doc is passed.
     """
 
+    rng = rng or random.Random()
     options = []
     if multiple_tokens:
         split = [token for token in doc]
@@ -65,46 +65,48 @@ def inflect_token(
         if multiple_tokens:
             pos_idx = [i for i in range(len(split)) if split[i].pos_ == pos]
             if pos_idx:
-                inflection_option = random.choice(inflection_options)
-                i = random.choice(pos_idx)
-                option = split[i]._.inflect(inflection_option)
+                inflection_option = rng.choice(inflection_options)
+                i = rng.choice(pos_idx)
+                option = inflect(split[i], inflection_option)
                 replaced = replace_element_in_token_list(split, option, i)
                 options.append(replaced)
 
         elif doc.pos_ == pos:
-            inflection_option = random.choice(inflection_options)
-            inflected_token = doc._.inflect(inflection_option)
+            inflection_option = rng.choice(inflection_options)
+            inflected_token = inflect(doc, inflection_option)
             return inflected_token
 
     return options
 
 
-def remove_token(doc: Doc) -> str:
+def remove_token(doc: Doc, rng: random.Random = None) -> str:
     """
     Remove a token in spacy Doc object if a token is auxiliary verb or determinant.
     """
 
+    rng = rng or random.Random()
     split = [token for token in doc]
     aux_idx = [i for i in range(len(split)) if split[i].pos_ in ["AUX", "DET"]]
     if aux_idx:
         split_copy = split[:]
-        split_copy.pop(random.choice(aux_idx))
+        split_copy.pop(rng.choice(aux_idx))
         joined = " ".join([token.text for token in split_copy]).strip()
         return joined
 
 
-def add_token(doc: Doc) -> str:
+def add_token(doc: Doc, rng: random.Random = None) -> str:
     """
     Add an article before noun.
     """
 
+    rng = rng or random.Random()
     split = [token for token in doc]
     noun_idx = [i for i in range(len(split)) if split[i].pos_ == "NOUN"]
     if noun_idx:
         split_copy = split[:]
-        i = random.choice(noun_idx)
+        i = rng.choice(noun_idx)
         options = ["a", "an", "the"]
-        split_copy.insert(i, random.choice(options))
+        split_copy.insert(i, rng.choice(options))
         joined = " ".join(
             [
                 token.text if not isinstance(token, str) else token
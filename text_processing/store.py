@@ -0,0 +1,250 @@
+"""
+Binary stores of texts, read through mmap.
+
+A store is a single file with variable-length records, record offsets and
+json metadata. Reading a record touches only its own pages of the file,
+so fetching a few sentences of a large text doesn't load the rest of it,
+and pages of a file are shared by all processes reading it.
+
+File layout:
+    records, each padded to 8 bytes
+    offsets of records, uint64 * (count + 1)
+    metadata, utf-8 json
+    count, metadata length (uint64 each), MAGIC
+"""
+
+from __future__ import annotations
+
+import array
+import json
+import mmap
+import os
+import struct
+import threading
+from collections.abc import Sequence
+from contextlib import contextmanager
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Tuple,
+    Union,
+)
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from spacy.tokens import Doc
+
+MAGIC = b"TXTSTOR1"
+TRAILER = struct.Struct("<QQ8s")
+# sentences of stores without version in metadata are prefixed by word count
+WORD_COUNT = struct.Struct("<I")
+
+
+def temporary_path(path: str) -> str:
+    """
+    Name a file is written under before it's renamed to path. It's unique
+    for every thread of every process, so concurrent writers of the same
+    file never write to the same temporary file.
+    """
+
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+class RecordStore(Sequence):
+    """
+    Read-only sequence of records of a store file.
+    Subclasses define how records are decoded.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            # mapping stays valid after the file is closed or replaced
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        count, meta_length, magic = TRAILER.unpack_from(
+            self._mmap, len(self._mmap) - TRAILER.size
+        )
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a text store.")
+        meta_start = len(self._mmap) - TRAILER.size - meta_length
+        self.meta = json.loads(self._mmap[meta_start : meta_start + meta_length])
+        self.offsets = np.frombuffer(
+            self._mmap,
+            dtype="<u8",
+            count=count + 1,
+            offset=meta_start - 8 * (count + 1),
+        )
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def record(self, i: int) -> memoryview:
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("store index out of range")
+        start, end = self.offsets[i : i + 2]
+        return memoryview(self._mmap)[start:end]
+
+    def decode(self, record: memoryview):
+        return bytes(record)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self.decode(self.record(i))
+
+    @staticmethod
+    @contextmanager
+    def create(path: str, meta: dict = None) -> Iterator[Callable[[bytes], None]]:
+        """
+        Writes a store: yields a function adding a record.
+        Metadata is written on exit, so it may be updated while writing.
+        File is written under a temporary name and renamed on success.
+        """
+
+        meta = {} if meta is None else meta
+        tmp_path = temporary_path(path)
+        try:
+            with open(tmp_path, "wb") as f:
+                offsets = array.array("Q", [0])  # 8 bytes per record
+
+                def add(record: bytes) -> None:
+                    f.write(record)
+                    f.write(b"\0" * (-len(record) % 8))
+                    offsets.append(offsets[-1] + len(record) + (-len(record) % 8))
+
+                yield add
+
+                # records are padded, so offsets don't need their own padding
+                # and can be stored as they are
+                f.write(np.asarray(offsets, dtype="<u8").tobytes())
+                meta_bytes = json.dumps(meta).encode()
+                f.write(meta_bytes)
+                f.write(TRAILER.pack(len(offsets) - 1, len(meta_bytes), MAGIC))
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+class SentenceStore(RecordStore):
+    """
+    Sentences of a text as utf-8 strings.
+    Word counts of sentences are kept in the text index, see TextIndex.
+    """
+
+    VERSION = 2
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._start = 0 if self.meta.get("version") else WORD_COUNT.size
+
+    def decode(self, record: memoryview) -> str:
+        return str(record[self._start :], "utf-8").rstrip("\0")
+
+    @classmethod
+    def write(cls, path: str, sentences: Iterable[str]) -> None:
+        with cls.create(path, {"version": cls.VERSION}) as add:
+            for sentence in sentences:
+                add(sentence.encode())
+
+
+class DocStore(RecordStore):
+    """
+    spaCy Docs, one per record, stored the way DocBin stores them:
+    token attributes array followed by token whitespace flags.
+    Attribute ids and strings of all Docs are kept in metadata.
+    Decoded records are (tokens, spaces) arrays, see ParsedText.
+    """
+
+    @property
+    def attrs(self) -> list:
+        return self.meta["attrs"]
+
+    @property
+    def strings(self) -> list:
+        return self.meta["strings"]
+
+    def decode(self, record: memoryview) -> Tuple[np.ndarray, np.ndarray]:
+        n_attrs = len(self.attrs)
+        # padding is shorter than a token, see RecordStore.create
+        n_tokens = len(record) // (8 * n_attrs + 1)
+        tokens = np.frombuffer(record, dtype="<u8", count=n_tokens * n_attrs)
+        spaces = np.frombuffer(
+            record, dtype=bool, count=n_tokens, offset=8 * n_tokens * n_attrs
+        )
+        return tokens.reshape((n_tokens, n_attrs)), spaces
+
+    @classmethod
+    @contextmanager
+    def writer(cls, path: str) -> Iterator[Callable[[Doc], None]]:
+        """
+        Writes a store: yields a function adding a Doc.
+        """
+
+        from spacy.attrs import SPACY
+        from spacy.tokens import DocBin
+
+        attrs = DocBin().attrs  # same attributes as DocBin, ORTH first
+        strings = set()
+        meta = {"attrs": attrs}
+        with cls.create(path, meta) as add_record:
+
+            def add(doc: Doc) -> None:
+                tokens = doc.to_array(attrs).astype("<u8").reshape((len(doc), -1))
+                spaces = doc.to_array(SPACY).astype(bool)
+                for token in doc:
+                    strings.update(
+                        (token.text, token.tag_, token.lemma_, token.norm_)
+                    )
+                    strings.update((str(token.morph), token.dep_, token.ent_type_))
+                add_record(tokens.tobytes() + spaces.tobytes())
+
+            yield add
+            meta["strings"] = sorted(strings)
+
+
+class ArrayStore(RecordStore):
+    """
+    Named one-dimensional numpy arrays, one per record. Name, dtype and
+    length of every array are kept in metadata, along with any other data.
+    Decoded records are read-only arrays backed by the mapping, so an array
+    is read from disk only when it's used.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._names = {name: i for i, (name, _, _) in enumerate(self.meta["arrays"])}
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return super().__getitem__(i)
+        record = self.record(i)
+        _, dtype, length = self.meta["arrays"][i]
+        return np.frombuffer(record, dtype=dtype, count=length)
+
+    def keys(self) -> List[str]:
+        return list(self._names)
+
+    def get(self, name: str) -> Union[np.ndarray, None]:
+        i = self._names.get(name)
+        return None if i is None else self[i]
+
+    @classmethod
+    def write(
+        cls, path: str, arrays: Dict[str, np.ndarray], meta: dict = None
+    ) -> None:
+        meta = dict(meta or {}, arrays=[])
+        with cls.create(path, meta) as add:
+            for name, values in arrays.items():
+                values = np.ascontiguousarray(values)
+                meta["arrays"].append([name, values.dtype.str, len(values)])
+                add(values.tobytes())
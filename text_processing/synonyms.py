@@ -0,0 +1,168 @@
+"""
+Synonym lookup using gensim word vectors.
+Results are cached per process and keyed by lowercased word.
+
+Synonyms of frequent words are read from a precomputed nearest neighbour
+table (see build_synonym_table), other words fall back to a full scan
+over the vectors, batched for several words at once.
+"""
+
+import os
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+
+from .cache import LRUCache
+from .registry import get_model, get_vectors
+from .store import temporary_path
+
+SYNONYM_CACHE_SIZE = int(os.getenv("SYNONYM_CACHE_SIZE", 50000))
+# sometimes gensim suggests punctuation marks as similar words
+PUNCTUATION = ',.;:!?"'
+
+cache = LRUCache(maxsize=SYNONYM_CACHE_SIZE)
+
+
+class SynonymTable:
+    """
+    Precomputed nearest neighbours of the most frequent words.
+    Row i of neighbours holds indices (into words) of synonyms of words[i],
+    most similar first. Only the first len(neighbours) words have a row,
+    the rest of the vocabulary are words referenced as neighbours.
+    """
+
+    def __init__(self, words: List[str], neighbours: np.ndarray):
+        self.words = words
+        self.neighbours = neighbours
+        self.index: Dict[str, int] = {
+            word: i for i, word in enumerate(words[: len(neighbours)])
+        }
+
+    def __contains__(self, word: str) -> bool:
+        return word in self.index
+
+    def __getitem__(self, word: str) -> Tuple[str, ...]:
+        row = self.neighbours[self.index[word]]
+        return tuple(self.words[i] for i in row)
+
+    @staticmethod
+    def paths(path: str) -> Tuple[str, str]:
+        return f"{path}.npy", f"{path}.vocab.txt"
+
+    @classmethod
+    def load(cls, path: str) -> "SynonymTable":
+        neighbours_path, vocab_path = cls.paths(path)
+        neighbours = np.load(neighbours_path, mmap_mode="r")
+        with open(vocab_path, encoding="utf-8") as f:
+            words = f.read().split("\n")
+        return cls(words, neighbours)
+
+    def save(self, path: str) -> None:
+        neighbours_path, vocab_path = self.paths(path)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_neighbours_path = temporary_path(neighbours_path)
+        tmp_vocab_path = temporary_path(vocab_path)
+        with open(tmp_neighbours_path, "wb") as f:
+            np.save(f, self.neighbours)
+        with open(tmp_vocab_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(self.words))
+        os.replace(tmp_neighbours_path, neighbours_path)
+        os.replace(tmp_vocab_path, vocab_path)
+
+
+def build_synonym_table(
+    vectors, num_words: int, num_synonyms: int, batch_size: int = 256
+) -> SynonymTable:
+    """
+    Finds num_synonyms nearest neighbours for the num_words most frequent words
+    (GloVe vocabulary is sorted by frequency).
+    Punctuation marks and the word itself are never selected as neighbours.
+    """
+
+    num_words = min(num_words, len(vectors))
+    normed = vectors.get_normed_vectors()
+    excluded = [vectors.key_to_index[mark] for mark in PUNCTUATION if mark in vectors]
+    neighbours = np.empty((num_words, num_synonyms), dtype=np.int64)
+
+    for start in range(0, num_words, batch_size):
+        stop = min(start + batch_size, num_words)
+        similarity = normed[start:stop] @ normed.T
+        similarity[:, excluded] = -np.inf
+        similarity[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+
+        top = np.argpartition(-similarity, num_synonyms, axis=1)[:, :num_synonyms]
+        top_similarity = np.take_along_axis(similarity, top, axis=1)
+        order = np.argsort(-top_similarity, axis=1)
+        neighbours[start:stop] = np.take_along_axis(top, order, axis=1)
+
+    # keep only vocabulary which is actually referenced, renumbering neighbours
+    # so that table rows come first
+    extra = np.setdiff1d(np.unique(neighbours), np.arange(num_words))
+    vocabulary = np.concatenate([np.arange(num_words), extra])
+    renumbered = np.empty(len(vectors), dtype=np.int32)
+    renumbered[vocabulary] = np.arange(len(vocabulary), dtype=np.int32)
+
+    words = [vectors.index_to_key[i] for i in vocabulary]
+    return SynonymTable(words, renumbered[neighbours])
+
+
+def _search_vectors(words: List[str], topn: int = 10) -> List[Tuple[str, ...]]:
+    """
+    Nearest neighbours of several in-vocabulary words at once:
+    one matrix product over the vocabulary instead of one per word.
+    """
+
+    vectors = get_vectors()
+    vectors.fill_norms()
+    queries = np.stack([vectors.get_vector(word, norm=True) for word in words])
+    similarity = (vectors.vectors @ queries.T) / vectors.norms[:, None]
+
+    excluded = [vectors.key_to_index[mark] for mark in PUNCTUATION if mark in vectors]
+    similarity[excluded] = -np.inf
+    for column, word in enumerate(words):
+        similarity[vectors.key_to_index[word], column] = -np.inf
+
+    top = np.argpartition(-similarity, topn, axis=0)[:topn]
+    top_similarity = np.take_along_axis(similarity, top, axis=0)
+    top = np.take_along_axis(top, np.argsort(-top_similarity, axis=0), axis=0)
+    return [tuple(vectors.index_to_key[i] for i in column) for column in top.T]
+
+
+def synonyms_for_many(words: List[str]) -> List[Union[Tuple[str, ...], None]]:
+    """
+    Returns synonyms for each of lowercased words, most similar first,
+    or None for words which are not in the vocabulary.
+    Words missing from cache and synonym table are searched for in one batch.
+    """
+
+    results = [cache.get(word) for word in words]
+    table = get_model("synonym_table")
+    missing = set()
+    for i, word in enumerate(words):
+        if results[i] is not None:
+            continue
+        if table is not None and word in table:
+            results[i] = cache[word] = table[word]
+        else:
+            missing.add(word)
+
+    if missing:
+        vectors = get_vectors()
+        # don't search for unknown words
+        missing = [word for word in missing if word in vectors.key_to_index]
+    if missing:
+        found = dict(zip(missing, _search_vectors(missing)))
+        for i, word in enumerate(words):
+            if word in found:
+                results[i] = cache[word] = found[word]
+
+    return results
+
+
+def find_synonyms(word: str) -> Union[Tuple[str, ...], None]:
+    """
+    Returns synonyms of a lowercased word, most similar first.
+    Returns None if the word is not in the vocabulary.
+    """
+
+    return synonyms_for_many([word])[0]
@@ -0,0 +1,230 @@
+"""
+Client for the text-to-speech API.
+
+One client (see get_client) is shared by all threads of a process. It keeps
+a pool of persistent connections, limits the number of concurrent requests,
+retries failed requests with exponential backoff within a deadline, and stops
+calling the API for a while after several consecutive failures (circuit
+breaker), so a failing backend doesn't slow down every exercise.
+
+Set TTS_API_URL to the stand-in server (`python -m text_processing.tts_server`)
+to test audio generation without network access.
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Union
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+BASE_DIR = Path(__file__).resolve().parent
+load_dotenv()
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+DEFAULT_API_URL = (
+    "https://api-inference.huggingface.co/models/facebook/fastspeech2-en-ljspeech"
+)
+API_URL = os.getenv("TTS_API_URL", DEFAULT_API_URL)
+API_TOKEN = os.getenv("HUGGINGFACE_API_TOKEN")
+
+MAX_CONCURRENCY = int(os.getenv("TTS_MAX_CONCURRENCY", 4))
+CONNECT_TIMEOUT = float(os.getenv("TTS_CONNECT_TIMEOUT", 3.05))  # seconds
+READ_TIMEOUT = float(os.getenv("TTS_READ_TIMEOUT", 30))
+DEADLINE = float(os.getenv("TTS_DEADLINE", 60))  # for all attempts of a request
+MAX_RETRIES = int(os.getenv("TTS_MAX_RETRIES", 3))
+BACKOFF = float(os.getenv("TTS_BACKOFF", 0.5))  # delay before the first retry
+FAILURE_THRESHOLD = int(os.getenv("TTS_FAILURE_THRESHOLD", 5))
+RESET_TIMEOUT = float(os.getenv("TTS_RESET_TIMEOUT", 60))
+
+# responses worth another attempt, huggingface returns 503 while loading model
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+logger = logging.getLogger(__name__)
+
+
+class TTSError(Exception):
+    """
+    Audio can't be synthesized at the moment.
+    """
+
+
+class CircuitBreaker:
+    """
+    Counts consecutive failures. After failure_threshold of them, calls are
+    not allowed for reset_timeout seconds, then a single trial call is
+    allowed: its success closes the breaker, its failure opens it again.
+    A trial call that ends without a result (see end_trial) lets the next
+    call be the trial.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = None  # thread making the trial call
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return (
+                self.opened_at is not None
+                and time.monotonic() - self.opened_at < self.reset_timeout
+            )
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            if self._trial is not None:  # another thread is making the trial call
+                return False
+            self._trial = threading.get_ident()
+            return True
+
+    def end_trial(self) -> None:
+        """
+        Ends the trial call of this thread, if it's making one.
+        Call it when the call ends, whether its result was recorded or not.
+        """
+
+        with self._lock:
+            if self._trial == threading.get_ident():
+                self._trial = None
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial = None
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class TTSClient:
+    def __init__(
+        self,
+        url: str,
+        token: Union[str, None] = None,
+        max_concurrency: int = MAX_CONCURRENCY,
+        deadline: float = DEADLINE,
+        max_retries: int = MAX_RETRIES,
+    ):
+        self.url = url
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.breaker = CircuitBreaker(FAILURE_THRESHOLD, RESET_TIMEOUT)
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+
+        self.session = requests.Session()
+        # one connection per concurrent request, all of them are kept alive
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+
+    def _post(self, text: str, timeout: float) -> requests.Response:
+        """
+        Makes a single request, raises TTSError if it's worth retrying.
+        """
+
+        if timeout <= 0:
+            raise TTSError("TTS request deadline exceeded.")
+        try:
+            response = self.session.post(
+                self.url,
+                json={"inputs": text},
+                timeout=(min(CONNECT_TIMEOUT, timeout), min(READ_TIMEOUT, timeout)),
+            )
+        except requests.RequestException as e:
+            raise TTSError(f"TTS request failed: {e}") from e
+
+        if response.status_code in RETRY_STATUSES:
+            raise TTSError(f"TTS API returned {response.status_code}")
+        return response
+
+    def synthesize(self, text: str) -> bytes:
+        """
+        Returns synthesized audio.
+        Raises TTSError if the API is failing or doesn't respond in time.
+        """
+
+        if not self.breaker.allow():
+            raise TTSError("TTS API is disabled after repeated failures.")
+        try:
+            return self._synthesize(text)
+        finally:
+            self.breaker.end_trial()
+
+    def _synthesize(self, text: str) -> bytes:
+        deadline = time.monotonic() + self.deadline
+        if not self._semaphore.acquire(timeout=self.deadline):
+            raise TTSError("Too many concurrent TTS requests.")
+
+        try:
+            attempt = 0
+            while True:
+                try:
+                    response = self._post(text, deadline - time.monotonic())
+                    break
+                except TTSError:
+                    # full jitter, so retries of concurrent requests spread out
+                    delay = random.uniform(0, BACKOFF * 2**attempt)
+                    attempt += 1
+                    if (
+                        attempt > self.max_retries
+                        or time.monotonic() + delay >= deadline
+                    ):
+                        self.breaker.record_failure()
+                        raise
+                    time.sleep(delay)
+        finally:
+            self._semaphore.release()
+
+        if not response.ok:  # not worth retrying, e.g. invalid token
+            self.breaker.record_failure()
+            raise TTSError(f"TTS API returned {response.status_code}: {response.text}")
+
+        self.breaker.record_success()
+        return response.content
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def is_configured() -> bool:
+    # stand-in server doesn't need a token
+    return bool(API_TOKEN) or API_URL != DEFAULT_API_URL
+
+
+def get_client() -> TTSClient:
+    global _client
+
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = TTSClient(API_URL, API_TOKEN)
+    return _client
+
+
+def is_available() -> bool:
+    """
+    Whether audio can be requested: API is configured and isn't failing.
+    """
+
+    return is_configured() and not get_client().breaker.is_open
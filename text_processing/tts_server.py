@@ -0,0 +1,101 @@
+"""
+Local stand-in for the text-to-speech API, for testing and load testing
+audio generation without network access. Answers POST requests with json
+{"inputs": text} with a synthetic WAV tone, longer for longer texts.
+
+Usage:
+    python3 -m text_processing.tts_server [--port 8001] [--delay 0.5]
+        [--error-rate 0.1]
+and set TTS_API_URL=http://127.0.0.1:8001 for the app.
+"""
+
+import argparse
+import io
+import json
+import math
+import random
+import struct
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SAMPLE_RATE = 16000
+SECONDS_PER_CHAR = 0.06
+MAX_SECONDS = 30
+FREQUENCY = 440  # Hz
+
+
+def make_wav(text: str) -> bytes:
+    seconds = min(max(len(text), 1) * SECONDS_PER_CHAR, MAX_SECONDS)
+    n_frames = int(seconds * SAMPLE_RATE)
+    frames = struct.pack(
+        f"<{n_frames}h",
+        *(
+            int(8000 * math.sin(2 * math.pi * FREQUENCY * i / SAMPLE_RATE))
+            for i in range(n_frames)
+        ),
+    )
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(frames)
+    return buffer.getvalue()
+
+
+class TTSHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep connections alive, as the real API
+    delay = 0.0
+    error_rate = 0.0
+
+    def send(self, status: int, content_type: str, body: bytes) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            text = json.loads(self.rfile.read(length))["inputs"]
+        except (ValueError, KeyError, TypeError):
+            self.send(400, "application/json", b'{"error": "Invalid request"}')
+            return
+
+        time.sleep(self.delay)
+        if random.random() < self.error_rate:
+            # same response as the real API gives while the model is loading
+            self.send(503, "application/json", b'{"error": "Model is loading"}')
+            return
+        self.send(200, "audio/wav", make_wav(text))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in text-to-speech API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument(
+        "--delay", type=float, default=0.0, help="seconds to wait before responding"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="share of 503 responses"
+    )
+    args = parser.parse_args()
+
+    TTSHandler.delay = args.delay
+    TTSHandler.error_rate = args.error_rate
+    server = ThreadingHTTPServer((args.host, args.port), TTSHandler)
+    print(f"Serving stand-in TTS API on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Sampling of windows of consecutive sentences suitable for exercises.
+
+Text index keeps prefix sums of sentence counts, so word and token counts
+of any window are found with two lookups, and sorted offsets of tokens of
+each part of speech, so skippable tokens of any window are counted with two
+binary searches. All valid windows for a set of exercise parameters are
+found at once.
+"""
+
+from __future__ import annotations
+
+import random
+from typing import TYPE_CHECKING, List, Union
+
+import numpy as np
+
+from .cache import LRUCache
+
+if TYPE_CHECKING:
+    from .parsed_text import TextIndex
+
+# bytes of valid windows cached by a sampler, windows of a set of parameters
+# take at most 4 bytes per sentence
+WINDOWS_CACHE_SIZE = 2 * 2**20
+
+
+def prefix_sum(values) -> np.ndarray:
+    """
+    Returns array with sums of values before each position, one item longer.
+    """
+
+    return np.concatenate([[0], np.cumsum(values, dtype=np.int64)])
+
+
+class WindowSampler:
+    """
+    Picks windows of `length` consecutive sentences that are long enough
+    (more than 3 words) and have enough tokens to skip.
+    Windows are identified by their first sentence.
+    Valid windows are cached for recently used combinations of parameters.
+    """
+
+    def __init__(self, index: TextIndex):
+        self.index = index
+        self.token_offsets = index.token_offsets
+        self.word_sums = index.word_sums
+        self.non_punct_sums = index.non_punct_sums
+        self.windows = LRUCache(
+            WINDOWS_CACHE_SIZE, getsize=lambda windows: windows.nbytes
+        )
+
+    def _count_pos(
+        self, pos: List[str], low: np.ndarray, high: np.ndarray
+    ) -> np.ndarray:
+        """
+        Counts tokens with given parts of speech in [low, high) offset ranges.
+        """
+
+        counts = np.zeros(len(low), dtype=np.int64)
+        for tag in set(pos):
+            positions = self.index.positions(tag)
+            # bounds are cast, so positions aren't copied to compare them
+            counts += np.searchsorted(positions, high.astype(positions.dtype))
+            counts -= np.searchsorted(positions, low.astype(positions.dtype))
+        return counts
+
+    def count_skippable(
+        self, length: int, pos: List[str], skip_length: int
+    ) -> np.ndarray:
+        """
+        Counts tokens which select_skippable_tokens would select in every
+        window, see spacy_token_processing module.
+        """
+
+        starts = np.arange(len(self.token_offsets) - length)
+        first = self.token_offsets[starts]
+        end = self.token_offsets[starts + length]
+
+        if "ALL" in pos:
+            non_punct = (
+                self.non_punct_sums[starts + length] - self.non_punct_sums[starts]
+            )
+            counts = np.maximum(non_punct - 1 - skip_length, 0)
+            return np.where(end - first > 2 * skip_length, counts, 0)
+
+        # the first token of a window and the last (skip_length - 1) ones
+        # can't be skipped, the rest are counted in [low, high) range
+        total = self.token_offsets[-1]
+        low = np.minimum(first + 1, total)
+        high = np.clip(end - skip_length + 1, low, total)
+        return self._count_pos(pos, low, high)
+
+    def valid_windows(
+        self, length: int, pos: List[str], skip_length: int, multiple_skips: bool
+    ) -> np.ndarray:
+        key = (
+            length,
+            ("ALL",) if "ALL" in pos else tuple(sorted(set(pos))),
+            skip_length,
+            multiple_skips,
+        )
+        windows = self.windows.get(key)
+        if windows is None:
+            starts = np.arange(len(self.word_sums) - length, dtype=np.int32)
+            words = self.word_sums[starts + length] - self.word_sums[starts]
+            required = skip_length if multiple_skips else 1
+            counts = self.count_skippable(length, pos, skip_length)
+            windows = starts[(words > 3) & (counts >= required)]
+            self.windows[key] = windows
+        return windows
+
+    def sample(
+        self,
+        length: int,
+        pos: List[str],
+        skip_length: int,
+        multiple_skips: bool = False,
+        rng: random.Random = None,
+    ) -> Union[int, None]:
+        """
+        Returns first sentence of a random valid window,
+        None if there are no valid windows.
+        """
+
+        windows = self.valid_windows(length, pos, skip_length, multiple_skips)
+        if not len(windows):
+            return None
+        rng = rng or random.Random()
+        return int(windows[rng.randrange(len(windows))])